@@ -0,0 +1,100 @@
+#include <clang/AST/ASTConsumer.h>
+#include <clang/AST/RecursiveASTVisitor.h>
+#include <clang/Basic/Diagnostic.h>
+#include <clang/Basic/FileManager.h>
+#include <clang/Basic/SourceManager.h>
+#include <clang/Basic/TargetInfo.h>
+#include <clang/Basic/TargetOptions.h>
+#include <clang/Frontend/CompilerInstance.h>
+#include <clang/Frontend/FrontendAction.h>
+#include <clang/Lex/Preprocessor.h>
+#include <clang/Parse/ParseAST.h>
+#include <clang/Rewrite/Core/Rewriter.h>
+#include <clang/Rewrite/Frontend/Rewriters.h>
+#include <clang/Tooling/Tooling.h>
+
+#include "macros.hh"
+#include "compilerUtils.hh"
+#include "consumer.hh"
+#include "server.hh"
+#include <fstream>
+#include <iostream>
+#include <llvm/Support/Host.h>
+#include <llvm/Support/raw_ostream.h>
+#include <llvm/Support/FileSystem.h>
+
+#include <algorithm>
+#include <regex>
+#include <sstream>
+#include <string>
+
+#undef DEBUG
+
+using namespace clang;
+using namespace std;
+
+
+
+
+
+// split "field_access,callsite" into the analyses
+static bool parseAnalyses(const string &arg, vector<string> &analyses) {
+  stringstream ss(arg);
+  string analysis;
+  while (getline(ss, analysis, ',')) {
+    if (find(ANALYSES.begin(), ANALYSES.end(), analysis) == ANALYSES.end()) {
+      cerr << "Unknown analysis: " << analysis << endl;
+      return false;
+    }
+    analyses.push_back(analysis);
+  }
+  return !analyses.empty();
+}
+
+
+int main(int argc, char **argv) {
+  parsePCHOption(argc, argv);
+  if (argc == 3 && string(argv[1]) == "--server") {
+    vector<string> analyses;
+    if (!parseAnalyses(argv[2], analyses)) {
+      return 1;
+    }
+    return runServer([&analyses](CompilerInstance &theCompiler, Rewriter &rewriter) {
+      MyMultiConsumer consumer(theCompiler.getASTContext(), rewriter, analyses);
+      consumeAST(theCompiler, consumer);
+      return consumer.toJson();
+    });
+  }
+
+  // <analysis>=<outfile> arguments
+  vector<string> analyses;
+  vector<string> outfiles;
+  bool validArgs = argc >= 3;
+  for (int i = 2; i < argc && validArgs; i++) {
+    string arg = argv[i];
+    size_t pos = arg.find('=');
+    validArgs = pos != string::npos && parseAnalyses(arg.substr(0, pos), analyses);
+    outfiles.push_back(arg.substr(pos + 1));
+  }
+
+  if (!validArgs || analyses.size() != outfiles.size()) {
+    cout << "Usage: ./analyze [--pch] <infile> <analysis>=<outfile> [<analysis>=<outfile> ...]" << endl;
+    cout << "       ./analyze [--pch] --server <analysis>[,<analysis> ...]" << endl;
+    cout << "analyses: field_access, callsite, dataflow" << endl;
+    return 1;
+  }
+
+  string infile = argv[1];
+
+  CompilerInstance theCompiler;
+  createCompilerInstance(theCompiler, infile);
+  Rewriter rewriter = createRewriter(theCompiler);
+
+  // one parse of infile for all the analyses
+  MyMultiConsumer consumer(theCompiler.getASTContext(), rewriter, analyses);
+  consumeAST(theCompiler, consumer);
+  for (size_t i = 0; i < analyses.size(); i++) {
+    consumer.dumpToJson(analyses[i], outfiles[i]);
+  }
+  return 0;
+}
@@ -16,6 +16,7 @@
 #include "macros.hh"
 #include "compilerUtils.hh"
 #include "consumer.hh"
+#include "server.hh"
 #include <fstream>
 #include <iostream>
 #include <llvm/Support/Host.h>
@@ -36,8 +37,18 @@ using namespace std;
 
 
 int main(int argc, char **argv) {
+  parsePCHOption(argc, argv);
+  if (argc == 2 && string(argv[1]) == "--server") {
+    return runServer([](CompilerInstance &theCompiler, Rewriter &rewriter) {
+      MyFieldAccessConsumer consumer(theCompiler.getASTContext(), rewriter);
+      consumeAST(theCompiler, consumer);
+      return consumer.toJson();
+    });
+  }
+
   if (argc < 3) {
-    cout << "Usage: ./field_access <infile> <outfile>" << endl;
+    cout << "Usage: ./field_access [--pch] <infile> <outfile>" << endl;
+    cout << "       ./field_access [--pch] --server" << endl;
     return 1;
   }
 
@@ -26,11 +26,19 @@
 using namespace clang;
 using namespace std;
 
+// drop a leading --pch argument, which loads the precompiled defs.hh (DEFS_PCH) instead of parsing it
+void parsePCHOption(int &argc, char **&argv);
+
+bool emitPCH(const string &header, const string &outfile);
+
 void consumeAST(CompilerInstance &CI, MyConsumer &consumer);
 
 void createCompilerInstance(CompilerInstance &theCompiler,
                             const string &filename);
 
+void createCompilerInstanceFromBuffer(CompilerInstance &theCompiler,
+                                      const string &code, const string &name);
+
 Rewriter createRewriter(CompilerInstance &CI);
 
 bool writeRewriterOutputToFile(Rewriter& rewriter, const string &filename);
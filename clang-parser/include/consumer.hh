@@ -30,8 +30,12 @@ public:
         fieldAccessVisitor.TraverseDecl(context.getTranslationUnitDecl());
     }
     
+    nlohmann::json toJson(){
+      return fieldAccessVisitor.dumpAccessToJson();
+    }
+
     void dumpAccessToJson(const string &filename){
-      nlohmann::json j = fieldAccessVisitor.dumpAccessToJson();
+      nlohmann::json j = toJson();
       if(!j.empty()){
         writeJSONToFile(j, filename);
       }
@@ -59,8 +63,12 @@ public:
         callsiteVisitor.TraverseDecl(context.getTranslationUnitDecl());
     }
     
+    nlohmann::json toJson(){
+      return callsiteVisitor.dumpCallsitesToJson();
+    }
+
     void dumpCallsitesToJson(const string &filename){
-      nlohmann::json j = callsiteVisitor.dumpCallsitesToJson();
+      nlohmann::json j = toJson();
       if(!j.empty()){
         writeJSONToFile(j, filename);
       }
@@ -88,8 +96,12 @@ public:
         dataflowVisitor.TraverseDecl(context.getTranslationUnitDecl());
     }
     
+    nlohmann::json toJson(){
+      return dataflowVisitor.dumpDataflowToJson();
+    }
+
     void dumpDataflowToJson(const string &filename){
-      nlohmann::json j = dataflowVisitor.dumpDataflowToJson();
+      nlohmann::json j = toJson();
       if(!j.empty()){
         writeJSONToFile(j, filename);
       }
@@ -106,6 +118,67 @@ private:
 };
 
 
+// all the analyses of the drivers above over one parse of the file (analyze_driver.cc)
+const vector<string> ANALYSES = {"field_access", "callsite", "dataflow"};
+
+class MyMultiConsumer : public MyConsumer {
+// constructor
+public:
+    explicit MyMultiConsumer(ASTContext &C, Rewriter &R, const vector<string> &analyses)
+    : MyConsumer(C, R), rewriter(R), context(C), fieldAccessVisitor(C, R), callsiteVisitor(C, R),
+      dataflowVisitor(C, R), analyses(analyses) {}
+
+    virtual void HandleTranslationUnit(ASTContext &context){
+        // the visitors only read the AST, so they can traverse the same translation unit in turn
+        for (const string &analysis : analyses) {
+          if (analysis == "field_access") {
+            fieldAccessVisitor.TraverseDecl(context.getTranslationUnitDecl());
+          } else if (analysis == "callsite") {
+            callsiteVisitor.TraverseDecl(context.getTranslationUnitDecl());
+          } else if (analysis == "dataflow") {
+            dataflowVisitor.TraverseDecl(context.getTranslationUnitDecl());
+          }
+        }
+    }
+
+    nlohmann::json toJson(const string &analysis){
+      if (analysis == "field_access") {
+        return fieldAccessVisitor.dumpAccessToJson();
+      } else if (analysis == "callsite") {
+        return callsiteVisitor.dumpCallsitesToJson();
+      }
+      return dataflowVisitor.dumpDataflowToJson();
+    }
+
+    // {analysis: result}, null for the empty results (that the single drivers do not write)
+    nlohmann::json toJson(){
+      nlohmann::json j = nlohmann::json::object();
+      for (const string &analysis : analyses) {
+        nlohmann::json result = toJson(analysis);
+        j[analysis] = result.empty() ? nlohmann::json() : result;
+      }
+      return j;
+    }
+
+    void dumpToJson(const string &analysis, const string &filename){
+      nlohmann::json j = toJson(analysis);
+      if(!j.empty()){
+        writeJSONToFile(j, filename);
+      }
+      else{
+        DBG_OUT << "JSON data is empty. Skipping file write." <<endl;
+      }
+    }
+
+private:
+    Rewriter &rewriter;
+    ASTContext &context;
+    FieldAccessVisitor fieldAccessVisitor;
+    CallsiteVisitor callsiteVisitor;
+    DataflowVisitor dataflowVisitor;
+    vector<string> analyses;
+};
+
 
 
 #endif
@@ -0,0 +1,20 @@
+#ifndef SERVER_HH
+#define SERVER_HH
+
+#include <clang/Frontend/CompilerInstance.h>
+#include <clang/Rewrite/Core/Rewriter.h>
+#include <nlohmann/json.hpp>
+#include <functional>
+
+using namespace clang;
+using namespace std;
+
+// parse the main file of the compiler instance and return the JSON result of the analysis
+using Analyzer = function<nlohmann::json(CompilerInstance &, Rewriter &)>;
+
+// --server mode of the drivers: analyze one file per line of stdin and write one result per line to stdout.
+// request:  {"src": "<path of the .c file>"} or {"code": "<source>", "name": "<file name for diagnostics>"}
+// response: {"result": <JSON the driver would write to its outfile, null if it writes nothing>} or {"error": "<message>"}
+int runServer(const Analyzer &analyze);
+
+#endif
@@ -0,0 +1,44 @@
+#include <clang/AST/ASTConsumer.h>
+#include <clang/AST/RecursiveASTVisitor.h>
+#include <clang/Basic/Diagnostic.h>
+#include <clang/Basic/FileManager.h>
+#include <clang/Basic/SourceManager.h>
+#include <clang/Basic/TargetInfo.h>
+#include <clang/Basic/TargetOptions.h>
+#include <clang/Frontend/CompilerInstance.h>
+#include <clang/Frontend/FrontendAction.h>
+#include <clang/Lex/Preprocessor.h>
+#include <clang/Parse/ParseAST.h>
+#include <clang/Rewrite/Core/Rewriter.h>
+#include <clang/Rewrite/Frontend/Rewriters.h>
+#include <clang/Tooling/Tooling.h>
+
+#include "macros.hh"
+#include "compilerUtils.hh"
+#include "consumer.hh"
+#include <fstream>
+#include <iostream>
+#include <llvm/Support/Host.h>
+#include <llvm/Support/raw_ostream.h>
+#include <llvm/Support/FileSystem.h>
+
+#include <regex>
+#include <sstream>
+#include <string>
+
+#undef DEBUG
+
+using namespace clang;
+using namespace std;
+
+
+
+
+
+int main(int argc, char **argv) {
+  if (argc < 3) {
+    cout << "Usage: ./emit_pch <header> <outfile>" << endl;
+    return 1;
+  }
+  return emitPCH(argv[1], argv[2]) ? 0 : 1;
+}
@@ -1,13 +1,46 @@
 #include "compilerUtils.hh"
+#include <clang/Serialization/ASTWriter.h>
+#include <clang/Serialization/PCHContainerOperations.h>
+#include <llvm/Support/MemoryBuffer.h>
 // #include "ast_visitor_interface.hh"
 
 using namespace clang;
 using namespace std;
 
 
-// define createCompilerInstance
-void createCompilerInstance(CompilerInstance &theCompiler,
-                            const string &filename) {
+// precompiled defs.hh, built next to the drivers by cmake (see emitPCH). Only loaded with --pch
+static string pchFile;
+
+void parsePCHOption(int &argc, char **&argv) {
+  if (argc >= 2 && string(argv[1]) == "--pch") {
+#ifdef DEFS_PCH
+    pchFile = DEFS_PCH;
+#endif
+    argv[1] = argv[0];
+    argv++;
+    argc--;
+  }
+}
+
+// a PCH older than defs.hh would be rejected by clang, parse defs.hh from source instead
+static bool usePCH() {
+  static int upToDate = -1;
+  if (upToDate == -1) {
+    llvm::sys::fs::file_status pchStatus, defsStatus;
+    upToDate = !pchFile.empty() && !llvm::sys::fs::status(pchFile, pchStatus);
+#ifdef DEFS_HH
+    if (upToDate && !llvm::sys::fs::status(DEFS_HH, defsStatus)) {
+      upToDate = pchStatus.getLastModificationTime() >= defsStatus.getLastModificationTime();
+    }
+#endif
+  }
+  return upToDate;
+}
+
+// set up everything but the main file. kind is TU_Prefix to build a PCH, which is loaded otherwise
+static void initCompilerInstance(CompilerInstance &theCompiler,
+                                 TranslationUnitKind kind = TU_Module) {
+  bool loadPCH = kind != TU_Prefix && usePCH();
   theCompiler.createDiagnostics();
   auto &options = theCompiler.getLangOpts();
   options.C17 = true;
@@ -19,16 +52,77 @@ void createCompilerInstance(CompilerInstance &theCompiler,
   theCompiler.createFileManager();
   auto &fileMgr = theCompiler.getFileManager();
   theCompiler.createSourceManager(fileMgr);
-  auto &sourceMgr = theCompiler.getSourceManager();
-  theCompiler.createPreprocessor(TU_Module);
+  // same steps as clang -include-pch: the #include of defs.hh in the .c files is then skipped by its include guard
+  auto &ppOptions = theCompiler.getPreprocessorOpts();
+  if (loadPCH) {
+    ppOptions.ImplicitPCHInclude = pchFile;
+  }
+  theCompiler.createPreprocessor(kind);
   theCompiler.createASTContext();
+  if (loadPCH) {
+    theCompiler.createPCHExternalASTSource(
+        pchFile, ppOptions.DisablePCHValidation,
+        ppOptions.AllowPCHWithCompilerErrors, nullptr, false);
+  }
+}
+
+static void beginSourceFile(CompilerInstance &theCompiler) {
+  theCompiler.getDiagnosticClient().BeginSourceFile(
+      theCompiler.getLangOpts(), &theCompiler.getPreprocessor());
+  theCompiler.getLangOpts().CommentOpts.ParseAllComments = true;
+}
+
+// define createCompilerInstance
+void createCompilerInstance(CompilerInstance &theCompiler,
+                            const string &filename) {
+  initCompilerInstance(theCompiler);
+  auto &fileMgr = theCompiler.getFileManager();
   const FileEntry *srcFile = fileMgr.getFile(filename).get();
   auto &srcMgr = theCompiler.getSourceManager();
   srcMgr.setMainFileID(
       srcMgr.createFileID(srcFile, SourceLocation(), clang::SrcMgr::C_User));
-  theCompiler.getDiagnosticClient().BeginSourceFile(
-      options, &theCompiler.getPreprocessor());
-  theCompiler.getLangOpts().CommentOpts.ParseAllComments = true;
+  beginSourceFile(theCompiler);
+}
+
+// same, with the source in memory (server mode). name is only used in diagnostics
+void createCompilerInstanceFromBuffer(CompilerInstance &theCompiler,
+                                      const string &code, const string &name) {
+  initCompilerInstance(theCompiler);
+  auto &srcMgr = theCompiler.getSourceManager();
+  srcMgr.setMainFileID(srcMgr.createFileID(
+      llvm::MemoryBuffer::getMemBufferCopy(code, name), clang::SrcMgr::C_User));
+  beginSourceFile(theCompiler);
+}
+
+// parse header with the options of the drivers and write it as a PCH to outfile
+bool emitPCH(const string &header, const string &outfile) {
+  CompilerInstance theCompiler;
+  initCompilerInstance(theCompiler, TU_Prefix);
+  auto &fileMgr = theCompiler.getFileManager();
+  auto &srcMgr = theCompiler.getSourceManager();
+  srcMgr.setMainFileID(srcMgr.createFileID(fileMgr.getFile(header).get(),
+                                           SourceLocation(), clang::SrcMgr::C_User));
+  beginSourceFile(theCompiler);
+
+  auto buffer = make_shared<PCHBuffer>();
+  PCHGenerator generator(theCompiler.getPreprocessor(), theCompiler.getModuleCache(),
+                         outfile, "", buffer, {});
+  ParseAST(theCompiler.getPreprocessor(), &generator, theCompiler.getASTContext(),
+           false, TU_Prefix);
+  theCompiler.getDiagnosticClient().EndSourceFile();
+  if (!buffer->IsComplete || theCompiler.getDiagnostics().hasErrorOccurred()) {
+    llvm::errs() << "Error building the PCH of " << header << "\n";
+    return false;
+  }
+
+  error_code EC;
+  llvm::raw_fd_ostream Out(outfile, EC, llvm::sys::fs::OF_None);
+  if (EC) {
+    llvm::errs() << "Error opening " << outfile << " for writing: " << EC.message() << "\n";
+    return false;
+  }
+  Out.write(buffer->Data.data(), buffer->Data.size());
+  return true;
 }
 
 Rewriter createRewriter(CompilerInstance &theCompiler) {
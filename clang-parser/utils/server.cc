@@ -0,0 +1,50 @@
+#include "server.hh"
+#include "compilerUtils.hh"
+#include <iostream>
+#include <stdexcept>
+#include <string>
+
+using namespace clang;
+using namespace std;
+
+
+static nlohmann::json handleRequest(const Analyzer &analyze, const string &line) {
+  nlohmann::json request = nlohmann::json::parse(line);
+
+  // a fresh compiler instance per file, as in the one-shot mode
+  CompilerInstance theCompiler;
+  if (request.contains("code")) {
+    createCompilerInstanceFromBuffer(theCompiler, request["code"].get<string>(),
+                                     request.value("name", string("input.c")));
+  } else {
+    string src = request.at("src").get<string>();
+    if (!llvm::sys::fs::exists(src)) {
+      throw runtime_error("cannot open " + src);
+    }
+    createCompilerInstance(theCompiler, src);
+  }
+  Rewriter rewriter = createRewriter(theCompiler);
+
+  nlohmann::json result = analyze(theCompiler, rewriter);
+  // the one-shot mode skips writing empty results
+  return nlohmann::json{{"result", result.empty() ? nlohmann::json() : result}};
+}
+
+
+int runServer(const Analyzer &analyze) {
+  string line;
+  while (getline(cin, line)) {
+    if (line.empty()) {
+      continue;
+    }
+    string response;
+    try {
+      response = handleRequest(analyze, line).dump();
+    } catch (const exception &e) {
+      response = nlohmann::json{{"error", e.what()}}.dump();
+    }
+    // one line per request, flushed so that the client is never blocked
+    cout << response << endl;
+  }
+  return 0;
+}
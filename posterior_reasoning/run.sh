@@ -76,22 +76,40 @@ result_json="$result_folder/results.json"
 
 
 # ---------- Step execution ----------
-create_and_clean_dir "$prep_folder"
-python prep.py /home/results/training_data/vardecoder_pred.jsonl /home/results/training_data/fielddecoder_pred.jsonl  "$data_root" "$prep_folder" ${test_flag:+--test}
-
-create_and_clean_dir "$equiv_vars_folder"
-python callgraph.py "$prep_folder" "$equiv_vars_folder" ${test_flag:+--test}
-
-create_and_clean_dir "$group_data_folder"
-python group_info.py "$equiv_vars_folder" "$prep_folder" "$data_root" "$group_data_folder" ${test_flag:+--test} > "$group_log"
-
-create_and_clean_dir "$layout_eval_folder"
-python vote_offset.py "$equiv_vars_folder/" "$prep_folder" "$group_data_folder" "$layout_eval_folder" ${test_flag:+--test} > "$vote_log"
-
-create_and_clean_dir "$final_folder"
-python vote_type.py "$layout_eval_folder" "$final_folder"
-
-python dump_result.py "$prep_folder" "$final_folder" "$data_root" --out "$result_json" ${test_flag:+--test}
+# each step is a stage (see process_data/stage_dag.py): it is skipped if its inputs, flags and scripts
+# did not change since its last run
+manifest_dir="$result_folder/manifests"
+stage="python ../process_data/stage_dag.py $manifest_dir"
+var_pred="/home/results/training_data/vardecoder_pred.jsonl"
+field_pred="/home/results/training_data/fielddecoder_pred.jsonl"
+test_param="test=${test_flag:+true}"
+
+create_dir "$prep_folder"
+$stage prep --inputs "$var_pred" "$field_pred" "$data_root/decompiled_vars" "$data_root/callsite" "$data_root/dataflow" "$data_root/field_access" \
+    --outputs "$prep_folder" --params "$test_param" --tools prep.py vote_utils.py utils.py \
+    -- python prep.py "$var_pred" "$field_pred" "$data_root" "$prep_folder" ${test_flag:+--test} || exit 1
+
+create_dir "$equiv_vars_folder"
+$stage callgraph --inputs "$prep_folder" --outputs "$equiv_vars_folder" --params "$test_param" --tools callgraph.py vote_utils.py utils.py \
+    -- python callgraph.py "$prep_folder" "$equiv_vars_folder" ${test_flag:+--test} || exit 1
+
+create_dir "$group_data_folder"
+$stage group_info --inputs "$equiv_vars_folder" "$prep_folder" "$data_root/align" --outputs "$group_data_folder" --stdout "$group_log" \
+    --params "$test_param" --tools group_info.py vote_utils.py utils.py \
+    -- python group_info.py "$equiv_vars_folder" "$prep_folder" "$data_root" "$group_data_folder" ${test_flag:+--test} || exit 1
+
+create_dir "$layout_eval_folder"
+$stage vote_offset --inputs "$equiv_vars_folder" "$prep_folder" "$group_data_folder" --outputs "$layout_eval_folder" --stdout "$vote_log" \
+    --params "$test_param" --tools vote_offset.py vote_utils.py utils.py \
+    -- python vote_offset.py "$equiv_vars_folder/" "$prep_folder" "$group_data_folder" "$layout_eval_folder" ${test_flag:+--test} || exit 1
+
+create_dir "$final_folder"
+$stage vote_type --inputs "$layout_eval_folder" --outputs "$final_folder" --tools vote_type.py vote_utils.py utils.py \
+    -- python vote_type.py "$layout_eval_folder" "$final_folder" || exit 1
+
+$stage dump_result --inputs "$prep_folder" "$final_folder" "$data_root/align" --outputs "$result_json" --params "$test_param" \
+    --tools dump_result.py vote_utils.py utils.py \
+    -- python dump_result.py "$prep_folder" "$final_folder" "$data_root" --out "$result_json" ${test_flag:+--test} || exit 1
 
 
 if [[ -z "$test_flag" ]]; then
@@ -376,10 +376,11 @@ def print_stat(data_list: List):
 
 
 def get_process_file_path(root_data_folder, folder_name, bin_name, fun_id):
+    # the per-function folders of process_data have a subfolder per binary
     if folder_name == 'decompiled_vars':
-        ret_path = os.path.join(root_data_folder, folder_name, f"{bin_name}-{fun_id}_var.json")
+        ret_path = os.path.join(root_data_folder, folder_name, bin_name, f"{bin_name}-{fun_id}_var.json")
     else:
-        ret_path = os.path.join(root_data_folder, folder_name, f"{bin_name}-{fun_id}.json")
+        ret_path = os.path.join(root_data_folder, folder_name, bin_name, f"{bin_name}-{fun_id}.json")
     if not os.path.exists(ret_path):
         return None
     return ret_path
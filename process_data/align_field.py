@@ -167,13 +167,10 @@ def main(align_folder, filed_access_folder, align_data_save_dir, train_data_save
     unavailable = 0
    
     # metadata = read_json(metadata_fpath)
-    for f in tqdm(get_file_list(align_folder), disable=target_bin):
+    for bin_dir, f in tqdm(iter_fun_files(align_folder, target_bin), disable=target_bin):
         if not f.endswith('.json'):
             continue
 
-        if target_bin and not f.startswith(target_bin):
-            continue
-
         fname = f.replace('.json', '')
         binname, fun_id = f.replace('.json', '').split('-')
 
@@ -184,16 +181,16 @@ def main(align_folder, filed_access_folder, align_data_save_dir, train_data_save
         
 
         try:
-            align_data = read_json(os.path.join(align_folder, f))
+            align_data = read_json(os.path.join(bin_dir, f))
             save_data = {
                 'funname': align_data['funname'],
                 'code': align_data['code'],
             }
-            if not os.path.exists(os.path.join(filed_access_folder, f)):
+            if not os.path.exists(get_fun_path(filed_access_folder, f)):
                 unavailable += 1
-                print(f"Cannot find the field access info file in {os.path.join(filed_access_folder, f)}")
+                print(f"Cannot find the field access info file in {get_fun_path(filed_access_folder, f)}")
                 continue
-            field_access_data = read_json(os.path.join(filed_access_folder, f))
+            field_access_data = read_json(get_fun_path(filed_access_folder, f))
 
             aligned_data = align_heap_access(f, align_data, field_access_data)
             if aligned_data: 
@@ -204,15 +201,15 @@ def main(align_folder, filed_access_folder, align_data_save_dir, train_data_save
                 unavailable += 1
                 continue
         except FileAlignException as e:
-            print(f'Error: {os.path.join(align_folder, f)} - {e.msg}')
+            print(f'Error: {os.path.join(bin_dir, f)} - {e.msg}')
             fail_cnt += 1
             continue
         except Exception as e:
-            print(f'[ERROR] (align heap) Other error {os.path.join(align_folder, f)} - {e}')
+            print(f'[ERROR] (align heap) Other error {os.path.join(bin_dir, f)} - {e}')
             fail_cnt += 1
             continue
         
-        dump_json(os.path.join(align_data_save_dir, f), save_data)
+        dump_json(get_fun_path(align_data_save_dir, f, create=True), save_data)
         gen_fielddecoder_data(fname, save_data, binname, fun_id, train_data_save_dir)
     print(f'Success: {success_cnt}, Fail: {fail_cnt}, Unavailable: {unavailable}')
 
@@ -8,7 +8,7 @@ import re
 
 def get_decompiled_code(code_dir, binname, hex_addr) -> str:
 
-    fpath = os.path.join(code_dir, f"{binname}-{hex_addr.upper()}.c")
+    fpath = get_fun_path(code_dir, f"{binname}-{hex_addr.upper()}.c")
     if not os.path.exists(fpath):
         raise FileAlignException(f'File {fpath} not found.')
     file_content = read_file(fpath, readlines=True)
@@ -318,7 +318,7 @@ def align_stack(align_data:Dict, binname, hex_addr, code_dir, save_dir):
     align_data['variable'] = vars
     align_data['cluster_var'] = complex_var
 
-    dump_json(os.path.join(save_dir, fname + '.json'), align_data)
+    dump_json(get_fun_path(save_dir, fname + '.json', create=True), align_data)
     return align_data
    
 
@@ -412,7 +412,7 @@ def gen_vardecoder_data(fname, align_stack_data, binname, fun_id, save_dir, igno
         }
     if label_data['cluster_var']:
         save_data['cluster_var'] = label_data['cluster_var']
-    dump_json(os.path.join(save_dir, fname+'.json'), save_data)
+    dump_json(get_fun_path(save_dir, fname+'.json', create=True), save_data)
     
     return success
 
@@ -0,0 +1,307 @@
+import argparse
+import os
+import sys
+import tempfile
+from utils import *
+from typing import Dict, List
+import json
+import queue
+import subprocess
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from error import ClangServerError
+import hashlib
+from gen_command import CLANG_BUILD_DIR, COMBINED_TOOL, get_invocations, get_tools, iter_jobs, pch_warning
+from prep_decompiled import DEFS_FILE
+from dedup import get_duplicated, run_deduped, clang_argv
+
+CLANG_TIMEOUT = 120   # seconds per file
+CLANG_MEM_LIMIT = 8192   # MB of address space per server process
+
+
+class ClangServer():
+    # a `<tool> --server` process of clang-parser: one request (line of JSON) at a time.
+    # experimental: utils/server.cc has not been built and checked against the one-shot tools yet.
+    # the combined tool also takes the analyses to run (`analyze --server field_access,callsite`).
+    # pch=True loads the precompiled defs.hh (`<tool> --pch`, experimental) instead of parsing it for every file.
+    # mem_limit (MB) bounds the address space of the process, clang then fails on the file that exceeds it
+    def __init__(self, tool, analyses=None, pch=False, mem_limit=None):
+        self.tool = tool
+        self.args = (['--pch'] if pch else []) + ['--server'] + ([','.join(analyses)] if tool == COMBINED_TOOL else [])
+        self.mem_limit = mem_limit
+        self.proc = None
+        self.timed_out = False
+
+    def start(self):
+        # clang diagnostics go to stderr, as in the one-shot mode
+        command = [os.path.join(CLANG_BUILD_DIR, self.tool)] + self.args
+        if self.mem_limit:
+            # set in a shell rather than in preexec_fn, which is not safe with the client's threads
+            command = ['sh', '-c', f'ulimit -v {self.mem_limit * 1024} && exec "$0" "$@"'] + command
+        self.proc = subprocess.Popen(command, stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True, bufsize=1)
+
+    def kill(self):
+        self.timed_out = True
+        self.proc.kill()
+
+    def analyze(self, src_file, code=None, timeout=None):
+        # the JSON result the one-shot tool would write to its outfile, None if it writes nothing.
+        # with code, src_file is only the name of the code in the diagnostics.
+        # the server is killed if it takes more than timeout seconds
+        if self.proc is None:
+            self.start()
+        request = {'src': src_file} if code is None else {'code': code, 'name': src_file}
+        self.timed_out = False
+        timer = threading.Timer(timeout, self.kill) if timeout else None
+        try:
+            self.proc.stdin.write(json.dumps(request) + '\n')
+            self.proc.stdin.flush()
+            if timer:
+                timer.start()
+            line = self.proc.stdout.readline()
+        except OSError:   # broken pipe
+            line = ''
+        finally:
+            if timer:
+                timer.cancel()
+        if not line or self.timed_out:
+            # the server crashed on this file (or was killed), the next request starts a new one
+            returncode = self.close()
+            if self.timed_out and not line:
+                raise ClangServerError(f'{self.tool} timed out after {timeout}s on {src_file}', 'timeout')
+            if not line:
+                raise ClangServerError(f'{self.tool} crashed on {src_file} (exit code {returncode})', 'crash')
+        response = json.loads(line)
+        if 'error' in response:
+            raise ClangServerError(f'{self.tool} failed on {src_file}: {response["error"]}')
+        return response['result']
+
+    def close(self):
+        # the exit code of the server
+        if self.proc is None:
+            return None
+        try:
+            self.proc.stdin.close()
+            self.proc.wait(timeout=10)
+        except (OSError, subprocess.TimeoutExpired):
+            self.proc.kill()
+            self.proc.wait()
+        returncode, self.proc = self.proc.returncode, None
+        return returncode
+
+
+class ClangCommand():
+    # the one-shot `<tool> <src> <out>` of gen_command.py (`analyze <src> <analysis>=<out> ...` for the combined tool)
+    # with the interface of ClangServer, for the tools run without --server
+    def __init__(self, tool, analyses=None, pch=False, mem_limit=None):
+        self.tool = tool
+        self.analyses = analyses if tool == COMBINED_TOOL else [tool]
+        self.pch = pch
+        self.mem_limit = mem_limit
+
+    def analyze(self, src_file, code=None, timeout=None):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            src_path = src_file
+            if code is not None:
+                src_path = os.path.join(tmp_dir, os.path.basename(src_file))
+                write_file(src_path, code)
+            out_files = {a: os.path.join(tmp_dir, a + '.json') for a in self.analyses}
+            command = clang_argv(os.path.join(CLANG_BUILD_DIR, self.tool), src_path, out_files, self.pch)
+            if self.mem_limit:
+                command = ['sh', '-c', f'ulimit -v {self.mem_limit * 1024} && exec "$0" "$@"'] + command
+            try:
+                # the output of the tool goes to stderr with the clang diagnostics, as in the shell commands
+                returncode = subprocess.run(command, stdout=sys.stderr, timeout=timeout).returncode
+            except subprocess.TimeoutExpired:
+                raise ClangServerError(f'{self.tool} timed out after {timeout}s on {src_file}', 'timeout')
+            if returncode != 0:
+                raise ClangServerError(f'{self.tool} crashed on {src_file} (exit code {returncode})', 'crash')
+            results = {a: read_json(out) if os.path.exists(out) else None for a, out in out_files.items()}
+        return results if self.tool == COMBINED_TOOL else results[self.tool]
+
+    def close(self):
+        return None
+
+
+class ClangServerPool():
+    # up to nproc servers per tool, started on first use. analyze() may be called by nproc threads at a time.
+    # invocations: (tool, analyses) as given by gen_command.get_invocations.
+    # server=False runs the one-shot tools instead (ClangCommand)
+    def __init__(self, invocations, nproc=1, mem_limit=None, server=True, pch=False):
+        self.idle = {tool: queue.Queue() for tool, _ in invocations}
+        self.servers = []
+        for tool, analyses in invocations:
+            for _ in range(nproc):
+                runner = (ClangServer if server else ClangCommand)(tool, analyses, pch, mem_limit)
+                self.servers.append(runner)
+                self.idle[tool].put(runner)
+
+    def analyze(self, tool, src_file, code=None, timeout=None):
+        server = self.idle[tool].get()
+        try:
+            return server.analyze(src_file, code, timeout)
+        finally:
+            self.idle[tool].put(server)
+
+    def close(self):
+        for server in self.servers:
+            server.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class ClangResultCache():
+    # results of the clang tools kept across runs in cache_dir/<analysis>/<key>.json, the key being the hash of
+    # the .c file and of the tool version (its executable and defs.hh, which every .c file includes).
+    # a result the tools do not write (nothing to report) is cached as null. The results with --pch are kept apart
+    def __init__(self, cache_dir, tools, pch=False):
+        self.cache_dir = cache_dir
+        defs_hash = sha256_file(DEFS_FILE) if os.path.exists(DEFS_FILE) else ''
+        mode = '+pch' if pch else ''
+        self.versions = {tool: sha256_file(os.path.join(CLANG_BUILD_DIR, tool)) + defs_hash + mode for tool in tools}
+
+    def paths(self, tool, src_file, analyses) -> Dict[str, str]:
+        with open(src_file, 'rb') as f:
+            key = hashlib.sha256(self.versions[tool].encode() + f.read()).hexdigest()
+        return {a: os.path.join(self.cache_dir, a, key + '.json') for a in analyses}
+
+    def get(self, tool, src_file, analyses) -> Dict:
+        # {analysis: result}, None unless all the analyses are cached
+        paths = self.paths(tool, src_file, analyses)
+        if not all(os.path.exists(path) for path in paths.values()):
+            return None
+        return {a: read_json(path) for a, path in paths.items()}
+
+    def put(self, tool, src_file, results:Dict):
+        for a, path in self.paths(tool, src_file, results).items():
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # written to a temporary file first, so that a concurrent or interrupted run never reads a partial entry
+            tmp_path = f'{path}.tmp{os.getpid()}-{threading.get_ident()}'
+            with open(tmp_path, 'w') as f:
+                json.dump(results[a], f)
+            os.replace(tmp_path, path)
+
+
+def save_result(out_file, result):
+    # same content as the file written by the one-shot tool (nothing for an empty result)
+    if result is not None:
+        with open(out_file, 'w') as f:
+            json.dump(result, f, indent=4, ensure_ascii=False)
+
+
+def main(src_dir, save_dir, target_bin, reason=False, dedup_map=None, nproc=1, separate=True,
+         timeout=CLANG_TIMEOUT, mem_limit=CLANG_MEM_LIMIT, status_file=None, cache_dir=None, server=False, pch=False):
+    # same results as running the commands of gen_command.py, with nproc workers. With server, each worker
+    # keeps one server process per tool (`<tool> --server`) instead of starting the tool for every file.
+    # the workers take the largest files first, so that no large file is left for the end.
+    # status_file gets a line `<file> <tool> <status> <seconds>` per job, status being ok, cached, error, crash or timeout.
+    # with cache_dir, the tools are only run on the files whose results are not in the cache (ClangResultCache)
+    duplicated = get_duplicated(dedup_map) if dedup_map else set()
+    store_dir = os.path.join(save_dir, 'dedup')
+    warning = pch_warning() if pch else None
+    if warning:
+        print(warning)
+
+    invocations = get_invocations(reason, separate)
+
+    status_lock = threading.Lock()
+    status_fp = open(status_file, 'a') if status_file else None
+    def record(src_file, tool, status, start):
+        if status_fp:
+            with status_lock:
+                status_fp.write(f'{src_file}\t{os.path.basename(tool)}\t{status}\t{time.perf_counter() - start:.3f}\n')
+                status_fp.flush()
+
+    cache = ClangResultCache(cache_dir, [tool for tool, _ in invocations], pch) if cache_dir else None
+    def save_results(out_files, results):
+        for a, out_file in out_files.items():
+            save_result(out_file, results[a])
+
+    with ClangServerPool(invocations, nproc, mem_limit, server, pch) as pool:
+        def run_tool(tool, src_file, out_files):
+            # False if the results were in the cache
+            tool = os.path.basename(tool)
+            results = cache.get(tool, src_file, out_files) if cache else None
+            if results is not None:
+                save_results(out_files, results)
+                return False
+            result = pool.analyze(tool, src_file, timeout=timeout)
+            # {analysis: result} for the combined tool
+            results = result if tool == COMBINED_TOOL else {tool: result}
+            if cache:
+                cache.put(tool, src_file, results)
+            save_results(out_files, results)
+            return True
+
+        def run_job(job):
+            tool, target, src_file, out_files = job
+            start, status = time.perf_counter(), 'ok'
+            try:
+                if target in duplicated:
+                    run_deduped(tool, src_file, out_files, store_dir, run_tool)
+                elif not run_tool(tool, src_file, out_files):
+                    status = 'cached'
+            except ClangServerError as e:
+                print(e.msg)
+                status = e.status
+            record(src_file, tool, status, start)
+
+        jobs = iter_jobs(src_dir, save_dir, target_bin, reason, separate)
+        with ThreadPoolExecutor(nproc) as executor:
+            jobs = sorted(jobs, key=lambda job: os.path.getsize(job[2]), reverse=True)
+            list(executor.map(run_job, jobs))
+
+    if status_fp:
+        status_fp.close()
+
+
+def _bench(src_dir, tool='field_access', limit=200, server=False):
+    # per-function time of a clang tool (all analyses for the combined one) with and without the precompiled defs.hh,
+    # on the first `limit` .c files of src_dir. server=False times the one-shot tool, as run by process_data.py
+    src_files = [os.path.join(bin_dir, f) for bin_dir, f in iter_fun_files(src_dir) if f.endswith('.c')][:limit]
+    times = {}
+    for pch in (False, True):
+        runner = (ClangServer if server else ClangCommand)(tool, get_tools(reason=True), pch=pch)
+        runner.analyze(src_files[0])   # process start-up
+        start = time.perf_counter()
+        for src_file in src_files:
+            runner.analyze(src_file)
+        times[pch] = (time.perf_counter() - start) / len(src_files)
+        runner.close()
+    mode = 'server' if server else 'one-shot'
+    print(f'{tool} ({mode}), {len(src_files)} functions: {times[False]*1000:.1f}ms per function without PCH, {times[True]*1000:.1f}ms with PCH ({times[False]/times[True]:.1f}x)')
+
+
+if __name__=='__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('src_dir')
+    parser.add_argument('save_dir')
+    parser.add_argument('--bin', required=False, default=None)
+    parser.add_argument('--reason', action='store_true')
+    parser.add_argument('--dedup', default=None, help='dedup map written by dedup.py')
+    parser.add_argument('--nproc', type=int, default=None, help='number of workers, each with its server processes (default: 1, or derived from --max_proc)')
+    parser.add_argument('--max_proc', type=int, default=None, help='number of binaries processed at the same time (MAX_PROC of process_data.sh); each gets cpu_count // max_proc workers')
+    parser.add_argument('--timeout', type=int, default=CLANG_TIMEOUT, help='seconds a server may spend on a file before it is killed')
+    parser.add_argument('--mem_limit', type=int, default=CLANG_MEM_LIMIT, help='MB of address space per server process (0: no limit)')
+    parser.add_argument('--status', default=None, help='append the status and wall time of each file to this file')
+    parser.add_argument('--cache_dir', default=None, help='reuse the results of unchanged files across runs')
+    parser.add_argument('--combined', action='store_true', help='the combined analyze tool instead of one tool per analysis (experimental)')
+    parser.add_argument('--server', action='store_true', help='keep the tools running in server mode (--server) instead of starting them for every file (experimental)')
+    parser.add_argument('--pch', action='store_true', help='load the precompiled defs.hh (experimental)')
+
+    args = parser.parse_args()
+
+    if args.nproc is not None:
+        nproc = args.nproc
+    elif args.max_proc is not None:
+        nproc = max(1, (os.cpu_count() or 1) // args.max_proc)
+    else:
+        nproc = 1
+
+    main(args.src_dir, args.save_dir, args.bin, args.reason, args.dedup, nproc, not args.combined,
+         args.timeout, args.mem_limit, args.status, args.cache_dir, args.server, args.pch)
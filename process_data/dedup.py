@@ -0,0 +1,116 @@
+import argparse
+import os
+from utils import *
+from typing import Dict, List, Tuple
+from collections import defaultdict
+import hashlib
+import subprocess
+import fcntl
+from prep_decompiled import HEADER, get_fun_addr
+from normalize import normalize_code, code_hash, relabel
+
+
+def build_dedup_map(decompiled_dir) -> Dict:
+    # group the functions (<binname>-<addr>) of all .decompiled files by the hash of their normalized .c file.
+    # only the groups with more than one function are kept
+    groups = defaultdict(list)
+    cnt = 0
+    for f in sorted(get_file_list(decompiled_dir)):
+        if not f.endswith('.decompiled'):
+            continue
+        binname = f[:-len('.decompiled')]
+        for fun in iter_decompiled(os.path.join(decompiled_dir, f)):
+            groups[code_hash(HEADER + fun['code'])].append(binname + '-' + get_fun_addr(fun))
+            cnt += 1
+    return {
+        'functions': cnt,
+        'unique': len(groups),
+        'groups': {h: fun_ids for h, fun_ids in groups.items() if len(fun_ids) > 1},
+    }
+
+
+def report(dedup_map:Dict) -> str:
+    cnt, unique = dedup_map['functions'], dedup_map['unique']
+    return f'{cnt} functions, {unique} unique bodies, dedup ratio {cnt / max(unique, 1):.2f}x ({cnt - unique} duplicates in {len(dedup_map["groups"])} groups)'
+
+
+def get_duplicated(dedup_map_path) -> set:
+    # fun_ids that share their body with another function
+    return {fun_id for fun_ids in read_json(dedup_map_path)['groups'].values() for fun_id in fun_ids}
+
+
+def duplicated_by_binary(dedup_map:Dict) -> Dict[str, List[str]]:
+    # {binname: sorted fun_ids of the binary that share their body with another function}
+    duplicated = defaultdict(list)
+    for fun_ids in dedup_map['groups'].values():
+        for fun_id in fun_ids:
+            duplicated[fun_id.rsplit('-', 1)[0]].append(fun_id)
+    return {binname: sorted(fun_ids) for binname, fun_ids in duplicated.items()}
+
+
+def clang_argv(tool, src_file, out_files:Dict[str, str], pch=False) -> List[str]:
+    # `<tool> <src> <out>` for a single analysis tool, `analyze <src> <analysis>=<out> ...` for the combined one.
+    # pch: `<tool> --pch ...`, which loads the precompiled defs.hh
+    options = ['--pch'] if pch else []
+    if len(out_files) == 1 and os.path.basename(tool) in out_files:
+        return [tool] + options + [src_file, out_files[os.path.basename(tool)]]
+    return [tool] + options + [src_file] + [f'{a}={out}' for a, out in out_files.items()]
+
+
+def parse_outputs(tool, args:List[str]) -> Dict[str, str]:
+    # inverse of the output arguments of clang_argv
+    if len(args) == 1 and '=' not in args[0]:
+        return {os.path.basename(tool): args[0]}
+    return dict(arg.split('=', 1) for arg in args)
+
+
+def run_deduped(tool, src_file, out_files:Dict[str, str], store_dir, run_tool=None, pch=False):
+    # run the clang tool once per normalized body: the first function of a group runs it and stores the
+    # results in store_dir under the body hash, the others (possibly in another process) get a relabeled copy.
+    # out_files maps the analyses of the tool to their result files.
+    # run_tool(tool, src_file, out_files) runs the tool, by default as a subprocess (with --pch if pch)
+    code = read_file(src_file, readlines=False)
+    normalized, labels = normalize_code(code)
+    stored = os.path.join(store_dir, '+'.join(out_files), hashlib.sha256(normalized.encode()).hexdigest() + '.json')
+    os.makedirs(os.path.dirname(stored), exist_ok=True)
+
+    with open(stored + '.lock', 'w') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        if not os.path.exists(stored):
+            tmp_outs = {a: f'{stored}.{a}.tmp{os.getpid()}' for a in out_files}
+            if run_tool is None:
+                subprocess.run(clang_argv(tool, src_file, tmp_outs, pch))
+            else:
+                run_tool(tool, src_file, tmp_outs)
+            # the tools do not write anything if there is nothing to report (or they fail)
+            results = {a: read_file(tmp, readlines=False) if os.path.exists(tmp) else None for a, tmp in tmp_outs.items()}
+            dump_json(stored, {'labels': labels, 'results': results})
+            for tmp in tmp_outs.values():
+                if os.path.exists(tmp):
+                    os.remove(tmp)
+
+    entry = read_json(stored)
+    for a, out_file in out_files.items():
+        if entry['results'][a] is not None:
+            write_file(out_file, relabel(entry['results'][a], entry['labels'], labels))
+
+
+if __name__=='__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('decompiled_dir', nargs='?', help='write the groups of functions with the same normalized code in all .decompiled files of this folder to dedup_map')
+    parser.add_argument('dedup_map', nargs='?')
+    parser.add_argument('--run', nargs='+', metavar='TOOL SRC OUT... STORE_DIR', help='run a clang tool on SRC through the store of deduplicated results (commands generated by gen_command.py --dedup)')
+    parser.add_argument('--pch', action='store_true', help='with --run, load the precompiled defs.hh (experimental)')
+    args = parser.parse_args()
+
+    if args.run:
+        if len(args.run) < 4:
+            parser.error('--run takes TOOL SRC OUT... STORE_DIR')
+        tool, src_file, *outs, store_dir = args.run
+        run_deduped(tool, src_file, parse_outputs(tool, outs), store_dir, pch=args.pch)
+    elif args.dedup_map is None:
+        parser.error('decompiled_dir and dedup_map are required without --run')
+    else:
+        dedup_map = build_dedup_map(args.decompiled_dir)
+        dump_json(args.dedup_map, dedup_map)
+        print(report(dedup_map))
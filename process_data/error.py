@@ -16,3 +16,16 @@ class VarAlignException(Exception):
     # only skip the variable
     def __init__(self, msg = ''):
         self.msg = msg
+
+
+class ClangServerError(Exception):
+    # a clang-parser server failed on one file. status: error, crash or timeout
+    def __init__(self, msg = '', status = 'error'):
+        self.msg = msg
+        self.status = status
+
+
+class StageError(Exception):
+    # the stages cannot be ordered (a cycle, or two stages with the same output)
+    def __init__(self, msg = ''):
+        self.msg = msg
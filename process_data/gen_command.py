@@ -1,28 +1,70 @@
 import argparse
 import os
 from utils import *
-from typing import Dict, List
+from typing import Dict, List, Tuple
 from tqdm import tqdm
+from dedup import get_duplicated, clang_argv
+from prep_decompiled import DEFS_FILE
+
+CLANG_BUILD_DIR = '/home/ReSym/clang-parser/build'
+PCH_FILE = os.path.join(CLANG_BUILD_DIR, 'defs.hh.pch')   # DEFS_FILE precompiled by the clang-parser build
 
 clang_commands = ['field_access']
 
 clang_commands_for_reasoning = ['callsite', 'dataflow']
 
-def main(src_dir, save_dir, target_bin, reason=False):
-    target_commands = clang_commands
-    if reason:
-        target_commands += clang_commands_for_reasoning
+# runs several of the analyses above over a single parse of the .c file (clang-parser/analyze_driver.cc)
+COMBINED_TOOL = 'analyze'
+
+
+def get_tools(reason=False) -> List[str]:
+    return clang_commands + clang_commands_for_reasoning if reason else list(clang_commands)
+
+
+def pch_warning():
+    # with --pch, the tools load PCH_FILE, unless it is missing or older than DEFS_FILE (clang would reject it).
+    # they then parse DEFS_FILE again for every function
+    if os.path.exists(PCH_FILE) and (not os.path.exists(DEFS_FILE) or os.path.getmtime(PCH_FILE) >= os.path.getmtime(DEFS_FILE)):
+        return None
+    return f'Warning: {PCH_FILE} is missing or older than {DEFS_FILE}. Rebuild clang-parser to precompile it.'
+
+
+def get_invocations(reason=False, separate=True) -> List[Tuple[str, List[str]]]:
+    # (tool, analyses it runs) to get all the analyses of each function. separate=False uses the combined
+    # analyze tool (experimental: its results have not been compared with the separate tools yet)
+    tools = get_tools(reason)
+    if separate or len(tools) == 1:
+        return [(c, [c]) for c in tools]
+    return [(COMBINED_TOOL, tools)]
 
-    for f in get_file_list(src_dir):
+
+def iter_jobs(src_dir, save_dir, target_bin, reason=False, separate=True):
+    # (tool, <binname>-<addr>, .c file, {analysis: result file}) of the functions of target_bin (all if None).
+    # the result files are in the subfolder of the binary in save_dir/<analysis>, which is created
+    for bin_dir, f in iter_fun_files(src_dir, target_bin):
         if not f.endswith(".c"):
             continue
-        if target_bin and not f.startswith(target_bin):
-            continue
-        
-        for c in target_commands:
-            target = f.replace('.c', '')
-            command = f"/home/ReSym/clang-parser/build/{c} {os.path.join(src_dir, f)} {os.path.join(save_dir, c, target+'.json')}"
-            print(command)
+
+        target = f.replace('.c', '')
+        for c, analyses in get_invocations(reason, separate):
+            yield c, target, os.path.join(bin_dir, f), {a: get_fun_path(os.path.join(save_dir, a), target+'.json', create=True) for a in analyses}
+
+
+def main(src_dir, save_dir, target_bin, reason=False, dedup_map=None, separate=True, pch=False):
+    # functions whose body appears more than once (dedup.py): analyzed once, the others get a copy of the result
+    duplicated = get_duplicated(dedup_map) if dedup_map else set()
+    dedup_script = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'dedup.py')
+    warning = pch_warning() if pch else None
+    if warning:
+        print(f'# {warning}')
+
+    for c, target, src_file, out_files in iter_jobs(src_dir, save_dir, target_bin, reason, separate):
+        if target in duplicated:
+            command = ' '.join(clang_argv(f"{CLANG_BUILD_DIR}/{c}", src_file, out_files))
+            command = f"python {dedup_script}{' --pch' if pch else ''} --run {command} {os.path.join(save_dir, 'dedup')}"
+        else:
+            command = ' '.join(clang_argv(f"{CLANG_BUILD_DIR}/{c}", src_file, out_files, pch))
+        print(command)
     
         
         
@@ -32,10 +74,13 @@ if __name__=='__main__':
     parser.add_argument('save_dir')
     parser.add_argument('--bin', required=False, default=None)
     parser.add_argument('--reason', action='store_true')
+    parser.add_argument('--dedup', default=None, help='dedup map written by dedup.py')
+    parser.add_argument('--combined', action='store_true', help='a single analyze command per function instead of one command per analysis (experimental)')
+    parser.add_argument('--pch', action='store_true', help='load the precompiled defs.hh (experimental)')
 
     args = parser.parse_args()
 
-    main(args.src_dir, args.save_dir, args.bin, args.reason)
+    main(args.src_dir, args.save_dir, args.bin, args.reason, args.dedup, not args.combined, args.pch)
 
 
 
@@ -36,6 +36,8 @@ def main(args):
 
     # Step 2: Generate or load split
     split = ensure_split(split_path, binaries, args.train, args.test)
+    if args.split_only:
+        return
 
     # Step 3: Prepare output files
     train_output_path = os.path.join(args.output_folder, f"{args.model}_train.jsonl")
@@ -43,9 +45,8 @@ def main(args):
     train_out = open(train_output_path, 'w')
     test_out = open(test_output_path, 'w')
 
-    # Step 4: Process input JSONs
-    input_files = get_file_list(args.input_folder)
-    for json_file in input_files:
+    # Step 4: Process input JSONs (one subfolder per binary)
+    for bin_dir, json_file in iter_fun_files(args.input_folder):
         if not json_file.endswith(".json"):
             continue
 
@@ -53,7 +54,7 @@ def main(args):
         if bin_name not in binaries:
             continue  # Skip if no corresponding decompiled file exists
 
-        json_path = os.path.join(args.input_folder, json_file)
+        json_path = os.path.join(bin_dir, json_file)
 
         json_data = read_json(json_path)
         line = json.dumps(json_data)
@@ -69,12 +70,15 @@ def main(args):
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
-    parser.add_argument("--input_folder", required=True, help="Folder containing JSON files")
+    parser.add_argument("--input_folder", help="Folder containing JSON files")
     parser.add_argument("--decompiled_folder", required=True, help="Folder containing .decompiled files")
     parser.add_argument("--output_folder", required=True, help="Folder to write output jsonl files")
     parser.add_argument("--train", type=float, default=0.8, help="Train split ratio")
     parser.add_argument("--test", type=float, default=0.2, help="Test split ratio")
-    parser.add_argument("--model", required=True, help="Model name (e.g., fielddecoder)")
+    parser.add_argument("--model", help="Model name (e.g., fielddecoder)")
+    parser.add_argument("--split_only", action="store_true", help="Only create split.json (if missing), no jsonl files")
 
     args = parser.parse_args()
+    if not args.split_only and (args.input_folder is None or args.model is None):
+        parser.error("--input_folder and --model are required unless --split_only is given")
     main(args)
\ No newline at end of file
@@ -78,7 +78,7 @@ def gen_prompt (code:str, expressions:List[str]):
 
 def gen_fielddecoder_data(fname, align_heap_data, binname, fun_id, save_dir):
         
-    save_fpath = os.path.join(save_dir, fname + '.json')
+    save_fpath = get_fun_path(save_dir, fname + '.json', create=True)
 
     save_data = gen_data_point (align_heap_data, binname, fun_id)
 
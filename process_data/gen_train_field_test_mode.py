@@ -7,15 +7,12 @@ from gen_train_field import gen_prompt
 
 def main(decompiled_files_dir, field_access_dir, save_dir, target_bin):
     # metadata = read_json(metadata_fpath)
-    for f in tqdm(get_file_list(field_access_dir), disable=(target_bin)):
+    for bin_dir, f in tqdm(iter_fun_files(field_access_dir, target_bin), disable=(target_bin)):
         if not f.endswith('.json'):
             continue
 
-        if target_bin and not f.startswith(target_bin):
-            continue
-
         binname, fun_id = f.replace('.json', '').split('-')
-        decompiled_file_path = os.path.join(decompiled_files_dir, f"{binname}-{fun_id}.c")
+        decompiled_file_path = get_fun_path(decompiled_files_dir, f"{binname}-{fun_id}.c")
         if not os.path.exists(decompiled_file_path):
             print(f"Cannot find code source file {decompiled_file_path}")
         
@@ -27,7 +24,7 @@ def main(decompiled_files_dir, field_access_dir, save_dir, target_bin):
         #     print(f"Error: cannot find project for binary {binname} in the metadata")
         #     continue
 
-        field_access_data = read_json(os.path.join(field_access_dir, f))
+        field_access_data = read_json(os.path.join(bin_dir, f))
         expressions = []
         for access in field_access_data:
             if access['expr'] in expressions:
@@ -46,7 +43,7 @@ def main(decompiled_files_dir, field_access_dir, save_dir, target_bin):
             'fun_id': fun_id,
             # 'proj': proj
         }
-        dump_json(os.path.join(save_dir, f), data)
+        dump_json(get_fun_path(save_dir, f, create=True), data)
 
 if __name__=='__main__':
     parser = argparse.ArgumentParser()
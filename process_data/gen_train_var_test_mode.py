@@ -7,15 +7,12 @@ from align_stack import gen_prompt
 
 def main(decompiled_files_dir, decompiled_vars_dir, save_dir, target_bin):
     # metadata = read_json(metadata_fpath)
-    for f in tqdm(get_file_list(decompiled_vars_dir), disable=(target_bin)):
+    for bin_dir, f in tqdm(iter_fun_files(decompiled_vars_dir, target_bin), disable=(target_bin)):
         if not f.endswith('.json'):
             continue
 
-        if target_bin and not f.startswith(target_bin):
-            continue
-
         binname, fun_id = f.replace('_var.json', '').split('-')
-        decompiled_vars_path = os.path.join(decompiled_files_dir, f"{binname}-{fun_id}.c")
+        decompiled_vars_path = get_fun_path(decompiled_files_dir, f"{binname}-{fun_id}.c")
         if not os.path.exists(decompiled_vars_path):
             print(f"Cannot find code source file {decompiled_vars_path}")
         
@@ -27,7 +24,7 @@ def main(decompiled_files_dir, decompiled_vars_dir, save_dir, target_bin):
         #     print(f"Error: cannot find project for binary {binname} in the metadata")
         #     continue
 
-        variable_data = read_json(os.path.join(decompiled_vars_dir, f))
+        variable_data = read_json(os.path.join(bin_dir, f))
         vars = [a['name'] for a in variable_data['argument']]
         for var in variable_data['variable']:
             if var['rbp_offset_dec'] is None:
@@ -45,7 +42,7 @@ def main(decompiled_files_dir, decompiled_vars_dir, save_dir, target_bin):
             'fun_id': fun_id,
             # 'proj': proj
         }
-        dump_json(os.path.join(save_dir, f.replace('_var.json', '.json')), data)
+        dump_json(get_fun_path(save_dir, f.replace('_var.json', '.json'), create=True), data)
 
 if __name__=='__main__':
     parser = argparse.ArgumentParser()
@@ -33,12 +33,15 @@ def decrement_hex(hex_str: str) -> str:
 
 
 
-def extract_var_from_subprog (subprog_file: Dict) -> List:
+def extract_var_from_subprog (subprog_file: Dict, type_table: TypeTable = None) -> List:
     # get all vars from subprogram file (json) as a List
+    # type_table: resolves `type_id` of the vars if the subprogram file is written with --type_table
     all_vars = []
     def _helper(sf: Dict) -> List:
         for child in sf['child']:
             if child['Tag'] == 'DW_TAG_formal_parameter' or child['Tag'] == 'DW_TAG_variable':
+                if type_table is not None:
+                    type_table.resolve(child['Attr'])
                 all_vars.append({'Tag': child['Tag'], 'Attr': child['Attr']}) # removing child
             if child['child']:
                 _helper(child)
@@ -161,11 +164,11 @@ def align_params(subprog_varmap : Dict, subprog_argmap: Dict, decompiled_varmap:
         decompiled_varlist[idx] = var
     return decompiled_varlist
 
-def align(var_file, subprogram_file, fname, is_main: bool):
+def align(var_file, subprogram_file, fname, is_main: bool, type_table: TypeTable = None):
     # fname for debug purpose only
 
     # get arg and var info from subprogs (debug info)
-    subprog_vars = extract_var_from_subprog(subprogram_file)
+    subprog_vars = extract_var_from_subprog(subprogram_file, type_table)
     subprog_arglist, subprog_argmap, subprog_varmap = get_varmap_subprog(subprog_vars, fname)
     # get arg and var info from decompiled code
     decompiled_arglist, decompiled_varmap = get_varmap_decompiled(var_file)
@@ -187,18 +190,15 @@ def align(var_file, subprogram_file, fname, is_main: bool):
 def main(var_dir, subprogram_dir, code_dir, align_save_dir, stack_data_save_dir, target_bin, ignore_complex):
 
     # metadata = read_json(metadata_fpath)
-    var_files = get_file_list(var_dir)
     error_cnt = 0
     success_cnt = 0
     train_data_cnt = 0
     is_main = False 
-    for f in tqdm(get_file_list(subprogram_dir), disable=(target_bin)):
+    type_tables = {}  # binname -> TypeTable (None if the binary has no type table)
+    for bin_dir, f in tqdm(iter_fun_files(subprogram_dir, target_bin), disable=(target_bin)):
         if not f.endswith('.json'):
             continue
 
-        if target_bin and not f.startswith(target_bin):
-            continue
-
         fname = f.replace('.json', '')
         binname, fun_id = fname.split('-')
         var_fname = binname + '-' + fun_id.upper()  + '_var.json'
@@ -210,21 +210,25 @@ def main(var_dir, subprogram_dir, code_dir, align_save_dir, stack_data_save_dir,
 
         try:
 
-            if var_fname not in var_files:
+            if not os.path.exists(get_fun_path(var_dir, var_fname)):
                 raise FileAlignException(f'Cannot find file {var_fname}. Skip')
                 continue
             
 
-            var_file = read_json(os.path.join(var_dir, var_fname))
-            subprogram_file = read_json(os.path.join(subprogram_dir, f))
-            align_data = align(var_file, subprogram_file, f, is_main = is_main)
+            if binname not in type_tables:
+                type_table_path = get_type_table_path(subprogram_dir, binname)
+                type_tables[binname] = TypeTable(type_table_path) if os.path.exists(type_table_path) else None
+
+            var_file = read_json(get_fun_path(var_dir, var_fname))
+            subprogram_file = read_json(os.path.join(bin_dir, f))
+            align_data = align(var_file, subprogram_file, f, is_main = is_main, type_table = type_tables[binname])
 
         except FileAlignException as e:
             print(f'Error: {var_fname} - {e.msg}')
             error_cnt += 1
             continue
         except Exception as e:
-            print(f'[ERROR] (init_align) Other error {os.path.join(var_dir, var_fname)} - {e}')
+            print(f'[ERROR] (init_align) Other error {get_fun_path(var_dir, var_fname)} - {e}')
             error_cnt += 1
             continue
 
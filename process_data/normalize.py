@@ -0,0 +1,35 @@
+import re
+import hashlib
+from typing import List, Tuple
+
+
+# normalization of decompiled code up to its address-based names, shared by dedup.py and the inference
+# scripts of training_src (this module only depends on the standard library)
+
+# IDA names that embed an address, e.g. sub_401220, loc_401F3A, dword_404040
+LABEL_PATTERN = re.compile(r'\b(?:j_sub|nullsub|sub|locret|loc|off|unk|byte|word|dword|qword|xmmword|stru|asc|flt|dbl)_[0-9A-F]+\b')
+STACK_OFFSET_PATTERN = re.compile(r'\[(\w+)([+-])[0-9A-Fa-f]+h\]')   # in IDA comments: // [rsp+8h] [rbp-18h]
+
+
+def normalize_code(code:str) -> Tuple[str, List[str]]:
+    # code with the labels numbered by first appearance and the stack offsets of comments dropped,
+    # and the labels in that order (to map the labels of two functions with the same normalized code)
+    labels = {}
+    def _canonical(match):
+        label = match.group(0)
+        if label not in labels:
+            labels[label] = f'{label.rsplit("_", 1)[0]}_@{len(labels)}'
+        return labels[label]
+    normalized = LABEL_PATTERN.sub(_canonical, code)
+    normalized = STACK_OFFSET_PATTERN.sub(r'[\1\2h]', normalized)
+    return normalized, list(labels)
+
+
+def code_hash(code:str) -> str:
+    return hashlib.sha256(normalize_code(code)[0].encode()).hexdigest()
+
+
+def relabel(text:str, src_labels:List[str], dst_labels:List[str]) -> str:
+    # replace the labels of one function by the labels of another function with the same normalized code
+    mapping = dict(zip(src_labels, dst_labels))
+    return LABEL_PATTERN.sub(lambda match: mapping.get(match.group(0), match.group(0)), text)
@@ -3,7 +3,9 @@ import os
 from utils import *
 from typing import Dict, List
 from tqdm import tqdm
+import re
 from error import ParseError
+from prep_decompiled import extract_comments   # shared declaration-block scanner
 
 
         
@@ -27,55 +29,6 @@ def process_funname(raw_addr:str) -> str:
         return None
 
 
-def extract_comments(fun_content:List[str]) -> List[Dict]:
-    # fun_content should be the content of a function, not a file
-    var_decl_pattern = r'^(.+?\s+\**)(\S+);\s+\/\/(.*)$'  # <g1> <g2>; // <g3>
-    rbp_offset_pattern = r'\[rbp(-[\d\w]+?)h\]'   # [rbp-<g1>h]
-    array_name_pattern = r'^(.*?)\[(\d+)\]$'  # <g1>[<g2>]
-
-
-    var_decl_info = []
-    for line in fun_content:
-        match = re.match(var_decl_pattern, line.strip())
-        if match:
-            var_type = match.group(1).strip()
-            var_name = match.group(2).strip()
-            comment = match.group(3).strip()
-
-            # parse var_name (handle array)
-            array_name_match = re.match(array_name_pattern, var_name)
-            if array_name_match:
-                var_name = array_name_match.group(1) 
-                array_size = int(array_name_match.group(2))  
-            else:
-                array_size = None
-
-            # parse comment, get rbp offset
-            rbp_offset = None
-            rbp_offset_match = re.search(rbp_offset_pattern, comment)
-            if rbp_offset_match:
-                rbp_offset = rbp_offset_match.group(1)
-            
-            rbp_offset_dec = hex_to_decimal(rbp_offset) if rbp_offset is not None else None
-
-            # handle *
-            ptr_level = var_name.count("*")
-            var_name = var_name.replace('*', "")
-
-            var_decl_info.append({
-                'name': var_name,
-                'type': var_type, 
-                'comment': comment.strip().replace('"',"`").replace("'", '`'),
-                'array_size': array_size,
-                'ptr_level': ptr_level,
-                'rbp_offset_hex': rbp_offset, 
-                'rbp_offset_dec': rbp_offset_dec,
-                'original_line': line.strip().replace('"',"`").replace("'", '`')
-            })
-           
-
-    return var_decl_info
-
 def parse_signature(file_content:List[str], funname:str=None) -> List[Dict]:
     # return list (in order)
     arg_info = []
@@ -150,14 +103,9 @@ def parse_decompiled(src_dir_or_file, save_dir):
         if not f.endswith(".decompiled"):
             continue
 
-        with open(f, 'r') as file:
-            content = file.read()
-
         fname = os.path.basename(f)
 
-        file_content:List = eval(content)
-
-        for fun in file_content:
+        for fun in iter_legacy_decompiled(f):
             _, tmp_addr, code = fun
             if tmp_addr.startswith('sub_'):
                 addr = process_funname(tmp_addr)
@@ -185,7 +133,7 @@ def parse_decompiled(src_dir_or_file, save_dir):
             save_data = {'argument': arg_info, 'variable': var_info}
 
             new_fname = fname.replace('.decompiled', '-' + str(addr) + '_var.json')
-            dump_json(os.path.join(save_dir,new_fname), save_data)
+            dump_json(get_fun_path(save_dir, new_fname, create=True), save_data)
 
 
 
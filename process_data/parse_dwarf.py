@@ -1,21 +1,48 @@
 from elftools.elf.elffile import ELFFile
+from elftools.elf.sections import NoteSection
 import argparse
-import io
+import contextlib
+import mmap
 from elftools.dwarf.locationlists import (
     LocationEntry, LocationExpr, LocationParser)
 from elftools.dwarf.descriptions import (
     describe_DWARF_expr, set_global_machine_arch)
-from pathlib import Path
-from typing import Dict, List
+from elftools.common.exceptions import DWARFError
+import elftools
+from typing import Dict, List, Set
+from collections import OrderedDict
+from bisect import bisect_left
 from utils import *
 from tqdm import tqdm
 import re
+import copy
+import hashlib
+import json
+import shutil
+from multiprocessing import Pool
 
 
 POINTER_SIZE = 8
+CU_RELATIVE_FORMS = ('DW_FORM_ref1', 'DW_FORM_ref2', 'DW_FORM_ref4', 'DW_FORM_ref8', 'DW_FORM_ref_udata')
+DIE_CACHE_SIZE = 4096   # max number of referenced DIEs kept by DieResolver
+PARALLEL_DEBUG_INFO_SIZE = 16 * 1024 * 1024   # parse the CUs of binaries with a larger .debug_info in parallel
+NPROC = 4   # number of processes used for such binaries
+CACHE_META = 'cache_meta.json'   # stored in each --cache_dir entry
 PRINT_TREE = False   # for debugging purpose
 DEBUG = False   # for debugging purpose
 
+# --var_schema: the DIEs (by tag) and attributes that init_align reads from the records.
+# Other DIEs are skipped together with their children, other attributes are not decoded
+VAR_ATTRS = ('DW_AT_name', 'DW_AT_location', 'DW_AT_type')
+VAR_SCHEMA = {
+    'DW_TAG_compile_unit': (),
+    'DW_TAG_subprogram': ('DW_AT_name', 'DW_AT_low_pc'),
+    'DW_TAG_lexical_block': (),   # scopes nested in a subprogram
+    'DW_TAG_inlined_subroutine': (),
+    'DW_TAG_formal_parameter': VAR_ATTRS,
+    'DW_TAG_variable': VAR_ATTRS,
+}
+
 def show_loclist(loclist, dwarfinfo, indent, cu_offset):
     """ Display a location list nicely, decoding the DWARF expressions
         contained within.
@@ -32,17 +59,103 @@ def show_loclist(loclist, dwarfinfo, indent, cu_offset):
 
 
 
+@contextlib.contextmanager
 def read_elf(fpath):
-    # Read the ELF file data into memory
+    # Map the ELF file instead of reading it into memory. Pages are only
+    # faulted in when pyelftools touches them (headers and .debug_* sections),
+    # and the page cache is shared by all workers reading the same binary.
+    # The mapping is closed when the with block ends, the long-lived workers
+    # of process_data.py go through many binaries.
     with open(fpath, 'rb') as f:
-        elfdata = f.read()
-
-    # Create a file-like object from the byte data
-    elffile = ELFFile(io.BytesIO(elfdata))
-    return elffile
-
-
-
+        elfdata = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    with elfdata:
+        if hasattr(elfdata, 'madvise'):
+            # sections are read by offset, no point in reading ahead
+            elfdata.madvise(mmap.MADV_RANDOM)
+
+        yield ELFFile(elfdata)
+
+
+
+
+
+def ref_offset(attr, cu) -> int:
+    # .debug_info offset of the DIE a reference attribute points to, None for the references that
+    # are not offsets into .debug_info (DW_FORM_ref_sig8, references to a supplementary file)
+    if attr.form in CU_RELATIVE_FORMS:
+        return cu.cu_offset + attr.value
+    if attr.form == 'DW_FORM_ref_addr':
+        return attr.value
+    return None
+
+
+class DieResolver():
+    # resolve DIEs by their .debug_info offset on first use, keep the most recently used ones
+    def __init__(self, dwarfinfo, maxsize:int=DIE_CACHE_SIZE):
+        self.dwarfinfo = dwarfinfo
+        self.maxsize = maxsize
+        self.cache = OrderedDict()   # offset -> DIE
+
+    def get(self, offset:int, cu=None):
+        # cu: the CU of offset if known (CU-relative references), otherwise it is looked up
+        if offset is None:
+            return None
+        die = self.cache.get(offset)
+        if die is not None:
+            self.cache.move_to_end(offset)
+            return die
+
+        try:
+            die = self.dwarfinfo.get_DIE_from_refaddr(offset, cu)
+        except (DWARFError, ValueError):
+            # offset is not inside the given CU (or any CU)
+            return None
+
+        self.cache[offset] = die
+        if len(self.cache) > self.maxsize:
+            self.cache.popitem(last=False)
+        return die
+
+    def get_ref(self, attr, cu):
+        # the DIE a reference attribute of a DIE of cu points to
+        return self.get(ref_offset(attr, cu), cu if attr.form in CU_RELATIVE_FORMS else None)
+
+    def release(self, cu):
+        # forget the DIEs of cu (see release_CU)
+        for offset in [offset for offset, die in self.cache.items() if die.cu is cu]:
+            del self.cache[offset]
+
+
+def release_CU(dwarfinfo, cu):
+    # pyelftools keeps every DIE it parsed in its CU (CompileUnit._dielist) and every CU in DWARFInfo._cu_cache,
+    # so all the DIEs of the binary would stay in memory. Drop them once the CU is processed, a later
+    # reference into the CU parses the DIEs it needs again.
+    # these are private attributes of pyelftools (as of 0.33): with another layout, nothing is released
+    if isinstance(getattr(cu, '_dielist', None), list) and isinstance(getattr(cu, '_diemap', None), list):
+        cu._dielist = []
+        cu._diemap = []
+    offsets, cus = getattr(dwarfinfo, '_cu_offsets_map', None), getattr(dwarfinfo, '_cu_cache', None)
+    if isinstance(offsets, list) and isinstance(cus, list) and len(offsets) == len(cus):
+        i = bisect_left(offsets, cu.cu_offset)
+        if i < len(cus) and cus[i] is cu:
+            del offsets[i]
+            del cus[i]
+
+
+class CUContext():
+    # per-CU state used when decoding attributes, set up once per CU instead of once per attribute
+    def __init__(self, dwarfinfo, cu):
+        self.dwarfinfo = dwarfinfo
+        self.cu = cu
+        self.cu_offset = cu.cu_offset
+        self.version = cu['version']
+        self._file_names = None  # decoded file table of the line program, built on first use
+
+    def file_name(self, file_index:int) -> str:
+        if self._file_names is None:
+            line_program = self.dwarfinfo.line_program_for_CU(self.cu)
+            self._file_names = [file_entry.name.decode() for file_entry in line_program['file_entry']]
+        return self._file_names[file_index - 1]
 
 
 def print_tree(s):
@@ -52,8 +165,6 @@ def print_tree(s):
 def debug_print(s):
     if DEBUG:
         print(s)
-# global dict, from offset to its DieDecription
-STRUCT_DICT = {}
 
 
 class DieDecription():
@@ -95,6 +206,71 @@ class DieDecription():
 
 
 
+def type_id(offset:int) -> str:
+    # ID of a type in the type table: the offset of its DIE
+    return hex(offset)
+
+
+class TypeCache():
+    # per-binary memo from type DIE offset to its DieDecription
+    # cached descriptions are shared, callers must copy before modifying them.
+    # not bounded: it holds at most one entry per type DIE of the binary and is dropped with it. Evicting
+    # would break table(), which needs every type referenced so far, and the cut of recursive structs
+    def __init__(self):
+        self.types = {}   # offset -> DieDecription
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, offset:int) -> DieDecription:
+        die_description = self.types.get(offset)
+        if die_description is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return die_description
+
+    def put(self, offset:int, die_description:DieDecription) -> DieDecription:
+        # a type can be described again while it is being described (e.g., a pointer to a struct
+        # reached through the struct's own members); keep the first one so that all references share it
+        return self.types.setdefault(offset, die_description)
+
+    def __contains__(self, offset:int) -> bool:
+        return offset in self.types
+
+    def table(self, offsets) -> Dict[str, Dict]:
+        # the given types, and the types of their fields, as one table keyed by type ID.
+        # fields refer to other entries by ID instead of embedding them (see utils.TypeTable)
+        offset_of = {id(d): offset for offset, d in self.types.items()}
+        todo = list(offsets)
+
+        def _ref(d:DieDecription):
+            offset = offset_of.get(id(d))
+            if offset is None:
+                # not a cached type (e.g., void), keep it inline
+                return d.attr_dict()
+            todo.append(offset)
+            return type_id(offset)
+
+        def _fields(fields:List[Dict]) -> List[Dict]:
+            return [{'field_name': field['field_name'], 'field_attr': _ref(field['field_attr'])} for field in fields]
+
+        table = {}
+        while todo:
+            offset = todo.pop()
+            if type_id(offset) in table:
+                continue
+            d = self.types[offset]
+            entry = d.attr_dict(skip_recursive=True)
+            entry['struct_fields'] = _fields(d.struct_fields)
+            entry['point_to_struct_fileds'] = _fields(d.point_to_struct_fileds)
+            table[type_id(offset)] = entry
+
+        return {tid: table[tid] for tid in sorted(table, key=lambda tid: int(tid, 16))}
+
+    def __str__(self) -> str:
+        return f"type cache: {len(self.types)} types, {self.hits} hits, {self.misses} misses"
+
+
 def process_addr(raw_addr:str) -> str:
     # 0x501992 -> 501992
     match = re.search(r'^0x([\w\d]+)$', raw_addr)
@@ -104,22 +280,71 @@ def process_addr(raw_addr:str) -> str:
         assert False
 
 
-def main(fpath, save_dir = None):
+def subprogram_addr(die) -> str:
+    # start address of a subprogram DIE, in the format of the output file names (e.g., 401136)
+    if 'DW_AT_low_pc' not in die.attributes:
+        return None
+    return process_addr(hex(die.attributes['DW_AT_low_pc'].value)).upper()
+
+
+def load_target_addrs(target_funcs, binname) -> Set[str]:
+    # start addresses of the decompiled functions of a binary
+    # target_funcs: the decompiled_vars folder (<binname>/<binname>-<addr>_var.json), or the .decompiled file of the binary
+    if os.path.isdir(target_funcs):
+        prefix, suffix = binname + '-', '_var.json'
+        return {f[len(prefix):-len(suffix)].upper() for f in get_file_list(get_bin_dir(target_funcs, binname)) if f.startswith(prefix) and f.endswith(suffix)}
+    return {hex(fun['addr'])[2:].upper() for fun in read_json(target_funcs)}
 
-    def describe_die(die, die_dict) -> DieDecription:   
+
+def select_CUs(dwarfinfo, target_addrs: Set[str]) -> List:
+    # CUs that may define one of the target functions: those .debug_aranges maps a target
+    # address to, plus those .debug_aranges does not describe at all
+    aranges = dwarfinfo.get_aranges()
+    if aranges is None or not aranges.entries:
+        return list(dwarfinfo.iter_CUs())
+
+    covered = {entry.info_offset for entry in aranges.entries}
+    targeted = {aranges.cu_offset_at_addr(int(addr, 16)) for addr in target_addrs}
+    return [CU for CU in dwarfinfo.iter_CUs() if CU.cu_offset in targeted or CU.cu_offset not in covered]
+
+
+def debug_info_size(fpath) -> int:
+    with read_elf(fpath) as elffile:
+        section = elffile.get_section_by_name('.debug_info')
+        return section.data_size if section is not None else 0
+
+
+def split_CUs(CUs: List, n: int) -> List[List[int]]:
+    # split the CUs (in order) into at most n consecutive chunks of about the same .debug_info size
+    total = sum(CU.size for CU in CUs)
+    chunks = [[] for _ in range(n)]
+    acc = 0
+    for CU in CUs:
+        chunks[min(n - 1, acc * n // max(total, 1))].append(CU.cu_offset)
+        acc += CU.size
+    return [chunk for chunk in chunks if chunk]
+
+
+def parse_binary(f, save_dir = None, type_table = False, target_funcs = None, cu_offsets = None, var_schema = False):
+    """ Extract the subprograms of the binary f and write them to save_dir/<binname>.
+        var_schema: only record the DIEs and attributes of VAR_SCHEMA.
+        cu_offsets: only parse these CUs (one chunk of parse_binary_parallel). The subprograms and
+        the type table are returned to the caller instead of being written.
+    """
+
+    def describe_die(die) -> DieDecription:   
         def _get_type(tmp_die) -> DieDecription:
             if 'DW_AT_type' in tmp_die.attributes:
-                target_type_die = die_dict.get(CU.cu_offset + tmp_die.attributes['DW_AT_type'].value)
+                target_type_die = die_resolver.get_ref(tmp_die.attributes['DW_AT_type'], tmp_die.cu)
                 if target_type_die is not None:
-                    return describe_die(target_type_die, die_dict)
+                    return describe_die(target_type_die)
             return DieDecription()
 
 
-        # Check STRUCT_DICT first
-        if die.offset in STRUCT_DICT:
-            return STRUCT_DICT[die.offset]
-
-
+        # Check the type cache first
+        cached = type_cache.get(die.offset)
+        if cached is not None:
+            return cached
 
         die_description = DieDecription()
 
@@ -168,7 +393,8 @@ def main(fpath, save_dir = None):
             if 'DW_AT_name' in die.attributes:
                 die_description.type_name = die.attributes['DW_AT_name'].value.decode()
 
-            STRUCT_DICT[die.offset] = die_description
+            # cache it before the members, so a (pointer to) itself resolves to this description
+            type_cache.put(die.offset, die_description)
 
 
             die_description.struct_fields = []
@@ -177,7 +403,6 @@ def main(fpath, save_dir = None):
                     member_name = child_die.attributes.get('DW_AT_name').value.decode() if 'DW_AT_name' in child_die.attributes else "<unknown>"  #TODO: should be fresh name
                     member_d = _get_type(child_die)
                     die_description.struct_fields.append({'field_name': member_name, 'field_attr': member_d})
-            STRUCT_DICT[die.offset] = die_description
 
 
         elif die.tag == 'DW_TAG_base_type':
@@ -211,7 +436,7 @@ def main(fpath, save_dir = None):
                     die_description.point_to_struct_fileds = tmp_d.struct_fields
 
             else:
-                die_description = tmp_d
+                die_description = copy.copy(tmp_d)   # tmp_d may be cached
 
 
                 if die.tag == 'DW_TAG_const_type':
@@ -227,11 +452,13 @@ def main(fpath, save_dir = None):
 
             
 
+        die_description = type_cache.put(die.offset, die_description)
+
         debug_print(die.tag)
         debug_print(die_description)
         return die_description
      
-    def die_info_rec(die, indent_level='    ') -> Dict:
+    def die_info_rec(die, cu_ctx:CUContext, indent_level='    ') -> Dict:
         """ A recursive function for showing information about a DIE and its
             children.
         """
@@ -257,50 +484,61 @@ def main(fpath, save_dir = None):
         child_indent = indent_level + '  '
         for attr in die.attributes.items():
             attr_name, attr_value = attr
+            if schema is not None and attr_name not in schema.get(die.tag, ()):
+                continue
             assert attr_name not in curr_tag_info['Attr']
-            description = print_attr_val(attr_name, attr_value)
+            description = print_attr_val(attr_name, attr_value, cu_ctx)
             if description is None:
                 continue
             curr_tag_info['Attr'][attr_name] = description.type_name if description.type_name is not None else '<unknown>'
             print_tree(child_indent + '|_' + '%s=%s' % (attr_name, curr_tag_info['Attr'][attr_name]))
             if description.istype:
-                curr_tag_info['Attr']['type_attr'] = description.attr_dict()
+                type_offset = ref_offset(attr_value, cu_ctx.cu)
+                if type_table and type_offset is not None and type_offset in type_cache:
+                    # refer to the shared type table instead of embedding the description
+                    curr_tag_info['Attr']['type_id'] = type_id(type_offset)
+                    referenced_types.add(type_offset)
+                else:
+                    curr_tag_info['Attr']['type_attr'] = description.attr_dict()
               
 
         for child in die.iter_children():
-            curr_tag_info['child'].append(die_info_rec(child, child_indent))
+            if schema is not None and child.tag not in schema:
+                continue
+            if target_addrs is not None and child.tag == 'DW_TAG_subprogram' and subprogram_addr(child) not in target_addrs:
+                # not decompiled, skip it together with its variables
+                continue
+            curr_tag_info['child'].append(die_info_rec(child, cu_ctx, child_indent))
 
 
         return curr_tag_info
 
-    def print_attr_val(attr_name, attr_value) -> DieDecription:
+    def print_attr_val(attr_name, attr_value, cu_ctx:CUContext) -> DieDecription:
         ret_d = DieDecription()
         if attr_name == 'DW_AT_decl_file':
-            line_program = dwarfinfo.line_program_for_CU(CU)
-            file_name = line_program['file_entry'][attr_value.value - 1].name
-            ret_d.type_name = file_name.decode()
+            ret_d.type_name = cu_ctx.file_name(attr_value.value)
             return ret_d
 
         elif attr_name == 'DW_AT_type' and 'ref' in attr_value.form:
            
-            type_die = global_die_dict.get(CU.cu_offset + attr_value.value )
+            type_die = die_resolver.get_ref(attr_value, cu_ctx.cu)
             if type_die is not None:
-                type_description = describe_die(type_die, global_die_dict)
-                ret_d = type_description
+                type_description = describe_die(type_die)
+                ret_d = copy.copy(type_description)
                 ret_d.istype = True
                 return ret_d
             else:
                 ret_d.istype = True
                 return ret_d
 
-        elif loc_parser.attribute_has_location(attr_value, CU['version']):
-            loc = loc_parser.parse_from_attribute(attr_value, CU['version'])
+        elif loc_parser.attribute_has_location(attr_value, cu_ctx.version):
+            loc = loc_parser.parse_from_attribute(attr_value, cu_ctx.version)
             # We either get a list (in case the attribute is a
             # reference to the .debug_loc section) or a LocationExpr
             # object (in case the attribute itself contains location
             # information).
             if isinstance(loc, LocationExpr):
-                loc_val = describe_DWARF_expr(loc.loc_expr, dwarfinfo.structs, CU.cu_offset)
+                loc_val = describe_DWARF_expr(loc.loc_expr, dwarfinfo.structs, cu_ctx.cu_offset)
             elif isinstance(loc, list): 
                 # do not handle this case
                 return None
@@ -316,40 +554,31 @@ def main(fpath, save_dir = None):
 
 
 
-    def _find_subprogram(json_block, binname):
+    def _find_subprogram(json_block, binname, found):
         if json_block['Tag'] == 'DW_TAG_subprogram' and 'funname' in json_block and 'fun_start_addr' in json_block:
             if json_block['funname'] != "<unknown>" and json_block['fun_start_addr'] != "<unknown>":
                 # functions strcat/strcpy have addr as unknown
                 curr_addr = process_addr(json_block['fun_start_addr'])
                 unique_addr = binname + '-' + curr_addr.upper()
-                if unique_addr not in visited_addr:
-                    visited_addr.add(unique_addr)   
-                dump_json(os.path.join(save_dir, unique_addr +'.json'), json_block)
+                found.append((unique_addr, json_block))
         for child in json_block['child']:
-            _find_subprogram(child, binname)
+            _find_subprogram(child, binname, found)
 
 
 
 
-    file_list = []
-    if os.path.isdir(fpath):
-        file_list = [os.path.join(fpath, f) for f in get_file_list(fpath)]
-    else:
-        file_list = [fpath]
-
-    
-    for f in tqdm(file_list, disable = len(file_list)==1):
-        STRUCT_DICT = {} # init struct_dict
-        debug_info ={}
+    type_cache = TypeCache()
+    schema = VAR_SCHEMA if var_schema else None
+    referenced_types = set()   # offsets of the types referred to by type_id
 
-        elffile = read_elf(f)
+    with read_elf(f) as elffile:
         if not elffile.has_dwarf_info():
             print('file has no DWARF info')
-            return
+            return None
         # get_dwarf_info returns a DWARFInfo context object, which is the
         # starting point for all DWARF-based processing in pyelftools.
         dwarfinfo = elffile.get_dwarf_info()
-        
+    
         # The location lists are extracted by DWARFInfo from the .debug_loc
         # section, and returned here as a LocationLists object.
         location_lists = dwarfinfo.location_lists()
@@ -364,33 +593,198 @@ def main(fpath, save_dir = None):
         loc_parser = LocationParser(location_lists)
 
 
-        global_die_dict = {} 
-        for CU in dwarfinfo.iter_CUs():
-            for die in CU.iter_DIEs():
-                global_die_dict[die.offset] = die
+        # type DIEs are parsed lazily when a DW_AT_type first refers to them
+        die_resolver = DieResolver(dwarfinfo)
+
+        binname = os.path.basename(f)
 
+        if target_funcs is not None:
+            # only describe the subprograms that are decompiled (and therefore aligned later)
+            target_addrs = load_target_addrs(target_funcs, binname)
+        else:
+            target_addrs = None
+
+        if cu_offsets is not None:
+            CUs = [dwarfinfo.get_CU_at(cu_offset) for cu_offset in cu_offsets]
+        elif target_addrs is not None:
+            CUs = select_CUs(dwarfinfo, target_addrs)
+        else:
+            CUs = dwarfinfo.iter_CUs()
+
+        subprograms = []   # (unique_addr, subprogram), only kept when returned to parse_binary_parallel
+        if cu_offsets is None:
+            get_bin_dir(save_dir, binname, create=True)
         # Traverse every DIE (Debugging Information Entry) in the .debug_info section
-        for CU in tqdm(dwarfinfo.iter_CUs(), disable = len(file_list)==1):
+        for CU in CUs:
             top_DIE = CU.get_top_DIE()
-            curr_file_path = Path(top_DIE.get_full_path()).as_posix()
 
             debug_print(CU.cu_offset)         
 
-            debug_info[curr_file_path] = die_info_rec(top_DIE)
-           
+            # emit the subprograms of this CU once, as soon as it is parsed;
+            # its tree is not kept around for the following CUs
+            found = []
+            _find_subprogram(die_info_rec(top_DIE, CUContext(dwarfinfo, CU)), binname, found)
+            die_resolver.release(CU)
+            release_CU(dwarfinfo, CU)
+            if cu_offsets is not None:
+                subprograms += found
+                continue
+            for unique_addr, json_block in found:
+                dump_json(get_fun_path(save_dir, unique_addr +'.json'), json_block)
+
+        if cu_offsets is not None:
+            return subprograms, type_cache.table(referenced_types) if type_table else {}, type_cache.hits, type_cache.misses
+
+        if type_table:
+            type_table_path = get_type_table_path(save_dir, binname)
+            os.makedirs(os.path.dirname(type_table_path), exist_ok=True)
+            dump_json(type_table_path, type_cache.table(referenced_types))
+
+        print(f'{binname}: {type_cache}, peak RSS {peak_rss_mb():.1f} MB')
 
-            binname = os.path.basename(f)
-            visited_addr = set()
-            for cu in debug_info:
-                _find_subprogram(debug_info[cu], binname)
+
+def _parse_CU_chunk(args):
+    f, cu_offsets, type_table, target_funcs, var_schema = args
+    return parse_binary(f, type_table=type_table, target_funcs=target_funcs, cu_offsets=cu_offsets, var_schema=var_schema)
+
+
+def parse_binary_parallel(f, save_dir = None, type_table = False, target_funcs = None, nproc = NPROC, var_schema = False):
+    # same output as parse_binary, with the CUs of one (large) binary split across nproc processes.
+    # every worker maps the ELF file itself; results are written back in CU order
+    with read_elf(f) as elffile:
+        if not elffile.has_dwarf_info():
+            print('file has no DWARF info')
+            return
+        dwarfinfo = elffile.get_dwarf_info()
+        binname = os.path.basename(f)
+
+        if target_funcs is not None:
+            CUs = select_CUs(dwarfinfo, load_target_addrs(target_funcs, binname))
+        else:
+            CUs = list(dwarfinfo.iter_CUs())
+    chunks = split_CUs(CUs, nproc)
+    if len(chunks) <= 1:
+        parse_binary(f, save_dir, type_table, target_funcs, var_schema=var_schema)
+        return
+
+    types = {}
+    hits, misses = 0, 0
+    get_bin_dir(save_dir, binname, create=True)
+    with Pool(len(chunks)) as pool:
+        # imap keeps the chunk order, so a function found in several CUs ends up as in parse_binary (last CU wins)
+        for subprograms, chunk_types, chunk_hits, chunk_misses in pool.imap(_parse_CU_chunk, [(f, chunk, type_table, target_funcs, var_schema) for chunk in chunks]):
+            for unique_addr, json_block in subprograms:
+                dump_json(get_fun_path(save_dir, unique_addr +'.json'), json_block)
+            types.update(chunk_types)
+            hits += chunk_hits
+            misses += chunk_misses
+
+    if type_table:
+        type_table_path = get_type_table_path(save_dir, binname)
+        os.makedirs(os.path.dirname(type_table_path), exist_ok=True)
+        dump_json(type_table_path, {tid: types[tid] for tid in sorted(types, key=lambda tid: int(tid, 16))})
+
+    print(f'{binname}: {len(chunks)} processes, type cache: {hits} hits, {misses} misses, peak RSS {peak_rss_mb():.1f} MB (largest worker {peak_rss_mb(children=True):.1f} MB)')
+
+
+def binary_id(fpath) -> str:
+    # GNU build-id of the ELF file, or the sha256 of its content if it has none
+    with read_elf(fpath) as elffile:
+        for section in elffile.iter_sections():
+            if isinstance(section, NoteSection):
+                for note in section.iter_notes():
+                    if note['n_type'] == 'NT_GNU_BUILD_ID':
+                        return note['n_desc']
+    return sha256_file(fpath)
+
+
+def cache_key(fpath, type_table, target_funcs, var_schema) -> str:
+    # everything the extracted records depend on: the binary, this extractor (with utils.py and pyelftools), and the output options
+    options = {
+        'extractor': sha256_file(__file__),
+        'utils': sha256_file(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'utils.py')),
+        'pyelftools': elftools.__version__,
+        'type_table': type_table,
+        'var_schema': var_schema,
+        'target_addrs': sorted(load_target_addrs(target_funcs, os.path.basename(fpath))) if target_funcs is not None else None,
+    }
+    return binary_id(fpath) + '-' + hashlib.sha256(json.dumps(options).encode()).hexdigest()[:16]
+
+
+def restore_from_cache(entry_dir, binname, save_dir) -> int:
+    # copy the records of a cache entry to save_dir, renamed for binname. Returns the number of subprograms
+    cached_binname = read_json(os.path.join(entry_dir, CACHE_META))['binname']
+    cnt = 0
+    cached_dir, bin_dir = get_bin_dir(entry_dir, cached_binname), get_bin_dir(save_dir, binname, create=True)
+    for fname in get_file_list(cached_dir):
+        shutil.copyfile(os.path.join(cached_dir, fname), os.path.join(bin_dir, binname + fname[len(cached_binname):]))
+        cnt += 1
+    cached_type_table = get_type_table_path(entry_dir, cached_binname)
+    if os.path.exists(cached_type_table):
+        type_table_path = get_type_table_path(save_dir, binname)
+        os.makedirs(os.path.dirname(type_table_path), exist_ok=True)
+        shutil.copyfile(cached_type_table, type_table_path)
+    return cnt
+
+
+def extract(f, save_dir, type_table, target_funcs, nproc, parallel_threshold, var_schema):
+    if nproc > 1 and debug_info_size(f) >= parallel_threshold:
+        parse_binary_parallel(f, save_dir, type_table, target_funcs, nproc, var_schema)
+    else:
+        parse_binary(f, save_dir, type_table, target_funcs, var_schema=var_schema)
+
+
+def extract_cached(f, save_dir, type_table, target_funcs, nproc, parallel_threshold, var_schema, cache_dir):
+    # extract into the cache entry of the binary (if not there yet), then restore the entry to save_dir
+    binname = os.path.basename(f)
+    entry_dir = os.path.join(cache_dir, cache_key(f, type_table, target_funcs, var_schema))
+    if os.path.isdir(entry_dir):
+        cnt = restore_from_cache(entry_dir, binname, save_dir)
+        print(f'{binname}: restored {cnt} subprograms from {entry_dir}')
+        return
+
+    # extract into a temporary folder first, so that an interrupted run never leaves a partial entry
+    tmp_dir = f'{entry_dir}.tmp{os.getpid()}'
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+    extract(f, tmp_dir, type_table, target_funcs, nproc, parallel_threshold, var_schema)
+    dump_json(os.path.join(tmp_dir, CACHE_META), {'binname': binname})
+    try:
+        os.rename(tmp_dir, entry_dir)
+    except OSError:
+        # another process stored the same entry in the meantime
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+    restore_from_cache(entry_dir, binname, save_dir)
+
+
+def main(fpath, save_dir = None, type_table = False, target_funcs = None, nproc = NPROC, parallel_threshold = PARALLEL_DEBUG_INFO_SIZE, cache_dir = None, var_schema = False):
+    file_list = []
+    if os.path.isdir(fpath):
+        file_list = [os.path.join(fpath, f) for f in get_file_list(fpath)]
+    else:
+        file_list = [fpath]
+
+    for f in tqdm(file_list, disable = len(file_list)==1):
+        if cache_dir is not None:
+            extract_cached(f, save_dir, type_table, target_funcs, nproc, parallel_threshold, var_schema, cache_dir)
+        else:
+            extract(f, save_dir, type_table, target_funcs, nproc, parallel_threshold, var_schema)
 
 if __name__=='__main__':
     parser = argparse.ArgumentParser()
     parser.add_argument('fpath')
     parser.add_argument('--save_dir', default=None, help='Optional save directory')
+    parser.add_argument('--type_table', action='store_true', help='write the types of each binary once to <save_dir>/types/<binname>.json and refer to them by type_id')
+    parser.add_argument('--target_funcs', default=None, help='only extract the functions that are decompiled: the decompiled_vars folder, or the .decompiled file of the binary')
+    parser.add_argument('--nproc', type=int, default=NPROC, help='number of processes used to parse a single large binary')
+    parser.add_argument('--parallel_threshold', type=int, default=PARALLEL_DEBUG_INFO_SIZE, help='parse the CUs of a binary in parallel if its .debug_info is at least this many bytes')
+    parser.add_argument('--cache_dir', default=None, help='reuse the records extracted from the same binary (build-id or content hash) by the same extractor in an earlier run')
+    parser.add_argument('--var_schema', action='store_true', help='only record the variables, parameters and subprograms that init_align reads, and only their name, location and type')
     args = parser.parse_args()
 
-    main(args.fpath, args.save_dir if args.save_dir is not None else None)
+    if args.cache_dir is not None:
+        os.makedirs(args.cache_dir, exist_ok=True)
+    main(args.fpath, args.save_dir if args.save_dir is not None else None, args.type_table, args.target_funcs, args.nproc, args.parallel_threshold, args.cache_dir, args.var_schema)
 
     
 
@@ -1,12 +1,29 @@
 import argparse
+import contextlib
 import os
 from utils import *
-from typing import Dict, List
+from typing import Dict, List, Tuple
 from tqdm import tqdm
 import re
+import json
 from error import ParseError
-
-HEADER = '#include "/home/ReSym/clang-parser/defs.hh"\n'
+from multiprocessing import Pool
+from collections import deque
+from itertools import islice
+
+DEFS_FILE = '/home/ReSym/clang-parser/defs.hh'
+HEADER = f'#include "{DEFS_FILE}"\n'
+WRITE_BATCH = 512   # number of output files buffered before they are written
+PREP_CHUNK = 256   # number of functions sent to a worker at a time (--nproc)
+PARALLEL_DECOMPILED_SIZE = 8 * 1024 * 1024   # only use --nproc processes for .decompiled files of at least this size
+
+VAR_DECL_PATTERN = re.compile(r'^(.+?\s+\**)(\S+);\s+\/\/(.*)$')  # <g1> <g2>; // <g3>
+# a declaration without comment, e.g. `int v1;`, `char *v2[4];` or `int (__fastcall *v3)(int);`: it does not end
+# the declaration block. Statements (`return v1;`, `sub_401000(a1);`, `++v1;`, ...) do
+UNCOMMENTED_DECL_PATTERN = re.compile(r'^(?!(?:return|goto)\b)[A-Za-z_][\w ]*?[ *]\s*'
+                                      r'(?:\**\w+(?:\[\d+\])*|\((?:\w+\s+)*\*+\w+(?:\[\d+\])*\)\s*(?:\([^;=]*\)|(?:\[\d+\])+));$')
+RBP_OFFSET_PATTERN = re.compile(r'\[rbp(-[\d\w]+?)h\]')   # [rbp-<g1>h]
+ARRAY_NAME_PATTERN = re.compile(r'^(.*?)\[(\d+)\]$')  # <g1>[<g2>]
 
 def process_funname(raw_addr:str) -> str:
     # sub_401220 -> 401220
@@ -33,53 +50,87 @@ def hex_to_decimal(hex_str : str) -> int:
 
 
 def extract_comments(fun_content:List[str]) -> List[Dict]:
-    var_decl_pattern = r'^(.+?\s+\**)(\S+);\s+\/\/(.*)$'  # <g1> <g2>; // <g3>
-    rbp_offset_pattern = r'\[rbp(-[\d\w]+?)h\]'   # [rbp-<g1>h]
-    array_name_pattern = r'^(.*?)\[(\d+)\]$'  # <g1>[<g2>]
-
-
+    # IDA declares all the local variables in one block right after the opening brace of the function,
+    # so the scan stops at the first statement
     var_decl_info = []
+    in_decl_block = False
     for line in fun_content:
-        match = re.match(var_decl_pattern, line.strip())
-        if match:
-            var_type = match.group(1).strip()
-            var_name = match.group(2).strip()
-            comment = match.group(3).strip()
-
-            # parse var_name (handle array)
-            array_name_match = re.match(array_name_pattern, var_name)
-            if array_name_match:
-                var_name = array_name_match.group(1) 
-                array_size = int(array_name_match.group(2))  
-            else:
-                array_size = None
+        line = line.strip()
+        if not in_decl_block:
+            in_decl_block = line == '{'
+            continue
+        match = VAR_DECL_PATTERN.match(line)
+        if not match:
+            if not line or UNCOMMENTED_DECL_PATTERN.match(line):
+                continue
+            break
 
-            # parse comment, get rbp offset
-            rbp_offset = None
-            rbp_offset_match = re.search(rbp_offset_pattern, comment)
-            if rbp_offset_match:
-                rbp_offset = rbp_offset_match.group(1)
-            
-            rbp_offset_dec = hex_to_decimal(rbp_offset) if rbp_offset is not None else None
-
-            # handle *
-            ptr_level = var_name.count("*")
-            var_name = var_name.replace('*', "")
-
-            var_decl_info.append({
-                'name': var_name,
-                'type': var_type, 
-                'comment': comment.strip().replace('"',"`").replace("'", '`'),
-                'array_size': array_size,
-                'ptr_level': ptr_level,
-                'rbp_offset_hex': rbp_offset, 
-                'rbp_offset_dec': rbp_offset_dec,
-                'original_line': line.strip().replace('"',"`").replace("'", '`')
-            })
+        var_type = match.group(1).strip()
+        var_name = match.group(2).strip()
+        comment = match.group(3).strip()
+
+        # parse var_name (handle array)
+        array_name_match = ARRAY_NAME_PATTERN.match(var_name)
+        if array_name_match:
+            var_name = array_name_match.group(1) 
+            array_size = int(array_name_match.group(2))  
+        else:
+            array_size = None
+
+        # parse comment, get rbp offset
+        rbp_offset = None
+        rbp_offset_match = RBP_OFFSET_PATTERN.search(comment)
+        if rbp_offset_match:
+            rbp_offset = rbp_offset_match.group(1)
+        
+        rbp_offset_dec = hex_to_decimal(rbp_offset) if rbp_offset is not None else None
+
+        # handle *
+        ptr_level = var_name.count("*")
+        var_name = var_name.replace('*', "")
+
+        var_decl_info.append({
+            'name': var_name,
+            'type': var_type, 
+            'comment': comment.strip().replace('"',"`").replace("'", '`'),
+            'array_size': array_size,
+            'ptr_level': ptr_level,
+            'rbp_offset_hex': rbp_offset, 
+            'rbp_offset_dec': rbp_offset_dec,
+            'original_line': line.replace('"',"`").replace("'", '`')
+        })
            
 
     return var_decl_info
 
+
+def extract_comments_batch(codes:List[str]) -> List[List[Dict]]:
+    # extract_comments for all the functions (code strings) of a binary, in one call
+    return [extract_comments(code.split('\n')) for code in codes]
+
+
+def _bench(src_dir='../sample_data/decompiled', repeat=50):
+    # microbenchmark: extract_comments vs. matching VAR_DECL_PATTERN against every line (as before),
+    # on the sample functions with their body repeated `repeat` times
+    import time
+    codes = []
+    for f in get_file_list(src_dir):
+        for fun in iter_decompiled(os.path.join(src_dir, f)):
+            head, brace, body = fun['code'].partition('\n{\n')
+            codes.append(head + brace + body * repeat)
+    lines = sum(code.count('\n') + 1 for code in codes)
+
+    start = time.perf_counter()
+    for code in codes:
+        [VAR_DECL_PATTERN.match(line.strip()) for line in code.split('\n')]
+    all_lines = time.perf_counter() - start
+
+    start = time.perf_counter()
+    extract_comments_batch(codes)
+    decl_block = time.perf_counter() - start
+    print(f'{len(codes)} functions, {lines} lines: every line {all_lines*1000:.0f}ms, declaration block {decl_block*1000:.0f}ms ({all_lines/decl_block:.1f}x)')
+
+
 def parse_signature(file_content:List[str], funname:str=None) -> List[Dict]:
     arg_info = []
     if not funname: 
@@ -143,55 +194,102 @@ def parse_signature(file_content:List[str], funname:str=None) -> List[Dict]:
 
 
 
-def prep_decompiled(src_dir_or_file, file_save_dir, parsed_save_dir):
-    if os.path.isdir(src_dir_or_file):
-        files = [os.path.join(src_dir_or_file, f) for f in get_file_list(src_dir_or_file)]
-    else:
-        files = [src_dir_or_file]
+def get_fun_addr(fun:Dict) -> str:
+    # <addr> of the <binname>-<addr> files of a function of a .decompiled file
+    if fun['funname'].startswith('sub_'):
+        return process_funname(fun['funname']).upper()
+    return str(hex(fun['addr']))[2:].upper()
 
 
+def prep_fun(fname:str, fun:Dict, file_save_dir, parsed_save_dir) -> Tuple[List[Tuple[str, str]], str]:
+    # outputs (path, content) of one function of the .decompiled file fname, and the error message if it cannot be parsed
+    funname, code = fun['funname'], fun['code']
+    addr = get_fun_addr(fun)
 
-    for f in tqdm(files, disable=len(files)==1):
-        if not f.endswith(".decompiled"):
-            continue
-        fname = os.path.basename(f)
+    code_with_header = HEADER + code
 
-        decompiled = read_json(f)
+    new_fname = fname.replace('.decompiled', '-' + str(addr))+'.c'
+    outputs = [(get_fun_path(file_save_dir, new_fname), code_with_header)]
 
-        for fun in decompiled:
-            dex_addr, funname, code = fun['addr'], fun['funname'], fun['code']
-            if funname.startswith('sub_'):
-                addr = process_funname(funname).upper()
-            else:
-                addr = str(hex(dex_addr))[2:].upper()
-                
-
-            code_with_header = HEADER + code
-
-            new_fname = fname.replace('.decompiled', '-' + str(addr))+'.c'
-            write_file(os.path.join(file_save_dir,new_fname), code_with_header)
-
-            # parse decompiled
-            code_lines = code.split('\n')
-            try:
-                if funname.startswith('sub_'):
-                    arg_info: List[Dict] = parse_signature(code_lines)
-                else:
-                    if funname.startswith('.'):
-                        funname = funname[1:]
-
-                    arg_info: List[Dict] = parse_signature(code_lines, funname=funname)
-                var_info: List[Dict] = extract_comments(code_lines)
-            except ParseError as e:
-                print(f'{fname} - {funname}: {e.msg}')
-                continue
-            except Exception as e:
-                print(f'[ERROR] (parse_decomplied) Other error {fname} - {funname}: {e}')
-                continue
-            save_data = {'argument': arg_info, 'variable': var_info}
+    # parse decompiled
+    code_lines = code.split('\n')
+    try:
+        if funname.startswith('sub_'):
+            arg_info: List[Dict] = parse_signature(code_lines)
+        else:
+            if funname.startswith('.'):
+                funname = funname[1:]
+
+            arg_info: List[Dict] = parse_signature(code_lines, funname=funname)
+        var_info: List[Dict] = extract_comments(code_lines)
+    except ParseError as e:
+        return outputs, f'{fname} - {funname}: {e.msg}'
+    except Exception as e:
+        return outputs, f'[ERROR] (parse_decomplied) Other error {fname} - {funname}: {e}'
+    save_data = {'argument': arg_info, 'variable': var_info}
+
+    var_fname = fname.replace('.decompiled', '-' + str(addr) + '_var.json')
+    outputs.append((get_fun_path(parsed_save_dir, var_fname), json.dumps(save_data, indent=4)))
+    return outputs, None
 
-            var_fname = fname.replace('.decompiled', '-' + str(addr) + '_var.json')
-            dump_json(os.path.join(parsed_save_dir, var_fname), save_data)
+
+def write_outputs(outputs:List[Tuple[str, str]]):
+    for path, content in outputs:
+        write_file(path, content)
+
+
+def _prep_chunk(args) -> List[Tuple[List[Tuple[str, str]], str]]:
+    fname, funs, file_save_dir, parsed_save_dir = args
+    return [prep_fun(fname, fun, file_save_dir, parsed_save_dir) for fun in funs]
+
+
+def prep_decompiled(src_dir_or_file, file_save_dir, parsed_save_dir, nproc = 1, parallel_threshold = PARALLEL_DECOMPILED_SIZE):
+    """ nproc: number of processes that prepare the functions of a .decompiled file of at least
+        parallel_threshold bytes, in chunks of PREP_CHUNK functions. Outputs are written in order by this process.
+    """
+    if os.path.isdir(src_dir_or_file):
+        files = [os.path.join(src_dir_or_file, f) for f in get_file_list(src_dir_or_file)]
+    else:
+        files = [src_dir_or_file]
+
+    # the pool is terminated when the with block ends, also on an exception (the long-lived workers of process_data.py go on)
+    use_pool = nproc > 1 and any(f.endswith(".decompiled") and os.path.getsize(f) >= parallel_threshold for f in files)
+    with Pool(nproc) if use_pool else contextlib.nullcontext() as pool:
+        for f in tqdm(files, disable=len(files)==1):
+            if not f.endswith(".decompiled"):
+                continue
+            fname = os.path.basename(f)
+            get_bin_dir(file_save_dir, fname[:-len('.decompiled')], create=True)
+            get_bin_dir(parsed_save_dir, fname[:-len('.decompiled')], create=True)
+
+            # the functions are read one at a time and their outputs written in batches of WRITE_BATCH,
+            # so memory does not grow with the size of the .decompiled file
+            pending = []
+            def collect(outputs, msg):
+                nonlocal pending
+                if msg is not None:
+                    print(msg)
+                pending += outputs
+                if len(pending) >= WRITE_BATCH:
+                    write_outputs(pending)
+                    pending = []
+
+            funs = iter_decompiled(f)
+            if pool is not None and os.path.getsize(f) >= parallel_threshold:
+                # at most 2 * nproc chunks are in flight, the results are collected in submission order
+                in_flight = deque()
+                for chunk in iter(lambda: list(islice(funs, PREP_CHUNK)), []):
+                    in_flight.append(pool.apply_async(_prep_chunk, ((fname, chunk, file_save_dir, parsed_save_dir),)))
+                    if len(in_flight) >= 2 * nproc:
+                        for outputs, msg in in_flight.popleft().get():
+                            collect(outputs, msg)
+                while in_flight:
+                    for outputs, msg in in_flight.popleft().get():
+                        collect(outputs, msg)
+            else:
+                for fun in funs:
+                    collect(*prep_fun(fname, fun, file_save_dir, parsed_save_dir))
+            write_outputs(pending)
 
 
 
@@ -201,7 +299,16 @@ if __name__=='__main__':
     parser.add_argument('src_dir_or_file')
     parser.add_argument('file_save_dir')
     parser.add_argument('parsed_save_dir')
+    parser.add_argument('--nproc', type=int, default=None, help='number of processes used for a large .decompiled file (default: 1, or derived from --max_proc)')
+    parser.add_argument('--max_proc', type=int, default=None, help='number of binaries processed at the same time (MAX_PROC of process_data.sh); each gets cpu_count // max_proc processes')
+    parser.add_argument('--parallel_threshold', type=int, default=PARALLEL_DECOMPILED_SIZE, help='use --nproc processes for .decompiled files of at least this many bytes')
     args = parser.parse_args()
-    prep_decompiled(args.src_dir_or_file, args.file_save_dir, args.parsed_save_dir)
+    if args.nproc is not None:
+        nproc = args.nproc
+    elif args.max_proc is not None:
+        nproc = max(1, (os.cpu_count() or 1) // args.max_proc)
+    else:
+        nproc = 1
+    prep_decompiled(args.src_dir_or_file, args.file_save_dir, args.parsed_save_dir, nproc, args.parallel_threshold)
 
-    
\ No newline at end of file
+    
@@ -0,0 +1,405 @@
+import argparse
+import os
+import sys
+import contextlib
+import heapq
+import time
+import multiprocessing
+import queue
+import shutil
+import traceback
+from utils import *
+
+# the stage modules are imported once here, the workers (forked) start with them loaded
+import prep_decompiled
+import parse_dwarf
+import init_align
+import clang_client
+import align_field
+import dedup
+import gen_train_field_test_mode
+import gen_train_var_test_mode
+from stage_dag import Stage, run_stages
+from gen_command import CLANG_BUILD_DIR, get_invocations
+from prep_decompiled import DEFS_FILE
+
+MAX_PROC = 20   # number of binaries processed at the same time
+CODE_DIR = os.path.dirname(os.path.abspath(__file__))
+# estimated time in seconds of processing a binary, for the largest-first scheduling (see estimate_cost)
+COST_PER_DECOMPILED_MB = 3.8
+COST_PER_FUNCTION = 0.0007
+COST_PER_DEBUG_INFO_MB = 1.25
+WORKER_POLL = 5   # seconds without a result after which main checks for dead workers
+# folders with a <binname>/<binname>-<addr> file per function
+PER_FUNCTION_DIRS = ['decompiled_files', 'decompiled_vars', 'debuginfo_subprograms', 'align_var', 'train_var',
+                     'field_access', 'align_field', 'train_field', 'callsite', 'dataflow']
+
+
+def get_dirs(source_dir) -> Dict[str, str]:
+    join = lambda name: os.path.join(source_dir, name)
+    return {
+        'bin': join('bin'),
+        'decompiled': join('decompiled'),
+        'decompiled_files': join('decompiled_files'),
+        'decompiled_vars': join('decompiled_vars'),
+        'debuginfo_subprograms': join('debuginfo_subprograms'),
+        'align_var': join('align'),
+        'train_var': join('train_var'),
+        'logs': join('logs'),
+        'field_access': join('field_access'),
+        'align_field': join('align_field'),
+        'train_field': join('train_field'),
+        'callsite': join('callsite'),
+        'dataflow': join('dataflow'),
+        'manifests': join('manifests'),   # per binary, the manifests of its stages
+        'dedup': join('dedup'),   # clang results shared by functions with the same (normalized) body
+        'dwarf_cache': join(os.path.join('cache', 'debuginfo_subprograms')),   # kept across runs, never cleaned
+        'clang_cache': join(os.path.join('cache', 'clang')),   # kept across runs, never cleaned
+    }
+
+
+def create_dir(target_dir):
+    if not os.path.isdir(target_dir):
+        os.makedirs(target_dir)
+        print(f"Created directory '{target_dir}'")
+
+
+def create_and_clean_dir(target_dir):
+    create_dir(target_dir)
+    for name in os.listdir(target_dir):
+        path = os.path.join(target_dir, name)
+        if os.path.isdir(path) and not os.path.islink(path):
+            shutil.rmtree(path)
+        else:
+            os.remove(path)
+
+
+def remove_folder_if_exists(folder):
+    if os.path.isdir(folder):
+        print(f'Removing folder: {folder}')
+        shutil.rmtree(folder)
+
+
+@contextlib.contextmanager
+def stage_log(log_path, stderr=False):
+    # output of a stage appended to log_path, as `>> log_path` (`>> log_path 2>&1` with stderr) did in the shell.
+    # stderr is redirected at the file descriptor level, for the clang servers started by the stage
+    with open(log_path, 'a') as f, contextlib.redirect_stdout(f):
+        if not stderr:
+            yield
+            return
+        sys.stderr.flush()
+        saved_fd = os.dup(2)
+        os.dup2(f.fileno(), 2)
+        try:
+            with contextlib.redirect_stderr(f):
+                yield
+        finally:
+            f.flush()
+            os.dup2(saved_fd, 2)
+            os.close(saved_fd)
+
+
+def run_stage(fun, *args, log=None, stderr=False) -> bool:
+    # a failing stage does not stop the other stages of the binary (each was a separate process before)
+    try:
+        with stage_log(log, stderr) if log else contextlib.nullcontext():
+            fun(*args)
+        return True
+    except Exception:
+        traceback.print_exc()
+        return False
+
+
+def tool_files(*modules) -> List[str]:
+    # the code a stage runs, its changes rerun the stage
+    return [os.path.join(CODE_DIR, module + '.py') for module in modules + ('utils', 'error')]
+
+
+def get_stages(binname, dirs, field, reason, test, max_proc, clang_server=False, duplicated=()) -> List[Stage]:
+    # the stages of a binary, see stage_dag.py. Outputs are the subfolders of binname in the per-function folders.
+    # duplicated: the functions of binname in the groups of dedup_map.json (dedup.duplicated_by_binary)
+    of_bin = lambda name: get_bin_dir(dirs[name], binname)
+    logs = dirs['logs']
+    nproc = max(1, (os.cpu_count() or 1) // max_proc)
+    decompiled_file = os.path.join(dirs['decompiled'], binname + '.decompiled')
+    type_table = get_type_table_path(dirs['debuginfo_subprograms'], binname)
+    stages = [Stage('prep_decompiled',
+                    lambda: run_stage(prep_decompiled.prep_decompiled, decompiled_file, dirs['decompiled_files'], dirs['decompiled_vars'], nproc,
+                                      log=os.path.join(logs, 'parse_decompiled_errors')),
+                    inputs=[decompiled_file], outputs=[of_bin('decompiled_files'), of_bin('decompiled_vars')],
+                    tools=tool_files('prep_decompiled'))]
+
+    if field:
+        # the field_access/callsite/dataflow tools, as the commands of gen_command.py. clang_server keeps them running
+        clang_tools = [os.path.join(CLANG_BUILD_DIR, tool) for tool, _ in get_invocations(reason)] + [DEFS_FILE]
+        stages.append(Stage('clang',
+                            lambda: run_stage(clang_client.main, dirs['decompiled_files'], os.path.dirname(dirs['field_access']), binname, reason,
+                                              os.path.join(dirs['dedup'], 'dedup_map.json'), nproc, True, clang_client.CLANG_TIMEOUT, clang_client.CLANG_MEM_LIMIT,
+                                              os.path.join(logs, 'clang_status'), dirs['clang_cache'], clang_server,
+                                              log=os.path.join(logs, 'clang_errors'), stderr=True),
+                            inputs=[of_bin('decompiled_files')], outputs=[of_bin('field_access'), of_bin('callsite'), of_bin('dataflow')],
+                            # only the part of the corpus-wide dedup map about this binary, so that other binaries do not rerun it
+                            params={'reason': reason, 'timeout': clang_client.CLANG_TIMEOUT, 'mem_limit': clang_client.CLANG_MEM_LIMIT, 'server': clang_server,
+                                    'duplicated': list(duplicated)},
+                            tools=tool_files('clang_client', 'gen_command', 'dedup', 'normalize', 'prep_decompiled') + clang_tools))
+
+    if test:
+        if field:
+            stages.append(Stage('gen_train_field',
+                                lambda: run_stage(gen_train_field_test_mode.main, dirs['decompiled_files'], dirs['field_access'], dirs['train_field'], binname),
+                                inputs=[of_bin('decompiled_files'), of_bin('field_access')], outputs=[of_bin('train_field')],
+                                tools=tool_files('gen_train_field_test_mode', 'gen_train_field')))
+        stages.append(Stage('gen_train_var',
+                            lambda: run_stage(gen_train_var_test_mode.main, dirs['decompiled_files'], dirs['decompiled_vars'], dirs['train_var'], binname),
+                            inputs=[of_bin('decompiled_files'), of_bin('decompiled_vars')], outputs=[of_bin('train_var')],
+                            tools=tool_files('gen_train_var_test_mode', 'align_stack')))
+        return stages
+
+    bin_file = os.path.join(dirs['bin'], binname)
+    stages.append(Stage('parse_dwarf',
+                        lambda: run_stage(parse_dwarf.main, bin_file, dirs['debuginfo_subprograms'], True, dirs['decompiled_vars'],
+                                          nproc, parse_dwarf.PARALLEL_DEBUG_INFO_SIZE, dirs['dwarf_cache'], True,
+                                          log=os.path.join(logs, 'parse_dwarf_log')),
+                        inputs=[bin_file, of_bin('decompiled_vars')], outputs=[of_bin('debuginfo_subprograms'), type_table],
+                        params={'type_table': True, 'var_schema': True},
+                        tools=tool_files('parse_dwarf')))
+    stages.append(Stage('init_align',
+                        lambda: run_stage(init_align.main, dirs['decompiled_vars'], dirs['debuginfo_subprograms'], dirs['decompiled_files'], dirs['align_var'], dirs['train_var'], binname, not field,
+                                          log=os.path.join(logs, 'align_errors')),
+                        inputs=[of_bin('decompiled_vars'), of_bin('debuginfo_subprograms'), type_table, of_bin('decompiled_files')],
+                        outputs=[of_bin('align_var'), of_bin('train_var')],
+                        params={'ignore_complex': not field},
+                        tools=tool_files('init_align', 'align_stack')))
+    if field:
+        stages.append(Stage('align_field',
+                            lambda: run_stage(align_field.main, dirs['align_var'], dirs['field_access'], dirs['align_field'], dirs['train_field'], binname,
+                                              log=os.path.join(logs, 'align_field_errors')),
+                            inputs=[of_bin('align_var'), of_bin('field_access')], outputs=[of_bin('align_field'), of_bin('train_field')],
+                            tools=tool_files('align_field', 'gen_train_field')))
+    return stages
+
+
+def process_binary(binname, dirs, field, reason, test, max_proc, clang_server=False, duplicated=None):
+    # only reruns the stages whose inputs, params or code changed since the last run on this binary
+    if not os.path.isfile(os.path.join(dirs['decompiled'], binname + '.decompiled')):
+        return
+    with stage_log(os.path.join(dirs['logs'], 'stages')):
+        print(f'=== {binname} ===')
+        run_stages(get_stages(binname, dirs, field, reason, test, max_proc, clang_server, (duplicated or {}).get(binname, ())), os.path.join(dirs['manifests'], binname))
+
+
+def remove_stale(dirs, binaries):
+    # results of the binaries that are no longer in the data folder
+    binaries = set(binaries)
+    for name in PER_FUNCTION_DIRS:
+        for binname in get_bin_list(dirs[name]):
+            if binname not in binaries:
+                shutil.rmtree(get_bin_dir(dirs[name], binname))
+    type_dir = os.path.dirname(get_type_table_path(dirs['debuginfo_subprograms'], ''))
+    if os.path.isdir(type_dir):
+        for f in get_file_list(type_dir):
+            if f[:-len('.json')] not in binaries:
+                os.remove(os.path.join(type_dir, f))
+    if os.path.isdir(dirs['manifests']):
+        for binname in os.listdir(dirs['manifests']):
+            if binname not in binaries:
+                shutil.rmtree(os.path.join(dirs['manifests'], binname))
+
+
+def worker(index, tasks, done, process, args):
+    # long-lived: processes binaries from the queue until it gets None. Posts (index, binname, None, None)
+    # when it starts a binary and (index, binname, elapsed, error) when it is done, error being None on success
+    for binname in iter(tasks.get, None):
+        done.put((index, binname, None, None))
+        start, error = time.perf_counter(), 'interrupted'
+        try:
+            process(binname, *args)
+            error = None
+        except Exception as e:
+            traceback.print_exc()
+            error = f'{type(e).__name__}: {e}'
+        finally:
+            done.put((index, binname, time.perf_counter() - start, error))
+
+
+def count_functions(decompiled_file, token=b'"funname":') -> int:
+    # number of functions of a .decompiled file without parsing it (0 in the legacy format)
+    cnt = 0
+    tail = b''
+    with open(decompiled_file, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            block = tail + block
+            cnt += block.count(token)
+            # keep the end of the block that could be the start of a token split between two blocks
+            tail = block[-(len(token) - 1):]
+            if token in tail:
+                tail = b''
+    return cnt
+
+
+def estimate_cost(binname, dirs, test) -> Dict:
+    # the .decompiled size and function count (prep_decompiled, clang, align), and the .debug_info size (parse_dwarf)
+    decompiled_file = os.path.join(dirs['decompiled'], binname + '.decompiled')
+    bin_file = os.path.join(dirs['bin'], binname)
+    if not os.path.isfile(decompiled_file):
+        return {'decompiled_mb': 0, 'functions': 0, 'debug_info_mb': 0, 'cost': 0}
+    features = {'decompiled_mb': os.path.getsize(decompiled_file) / (1 << 20), 'functions': count_functions(decompiled_file), 'debug_info_mb': 0}
+    if not test and os.path.isfile(bin_file):
+        try:
+            features['debug_info_mb'] = parse_dwarf.debug_info_size(bin_file) / (1 << 20)
+        except Exception:
+            pass
+    features['cost'] = (COST_PER_DECOMPILED_MB * features['decompiled_mb'] + COST_PER_FUNCTION * features['functions']
+                        + COST_PER_DEBUG_INFO_MB * features['debug_info_mb'])
+    return features
+
+
+def lpt_makespan(costs:List[float], nproc) -> float:
+    # makespan of the costs given in that order to the first free of nproc workers
+    loads = [0.0] * max(1, min(nproc, len(costs)))
+    for cost in costs:
+        heapq.heappush(loads, heapq.heappop(loads) + cost)
+    return max(loads)
+
+
+def main(source_dir, field=False, reason=False, clean=False, test=False, max_proc=MAX_PROC, clang_server=False):
+    if field:
+        print('Extracting both stack variables and field access information.')
+    else:
+        print('Extracting stack variables only.')
+    if reason:
+        print('Extract information for posterior reasoning. Will keep necessary intermediate results for posterior reasoning even if --clean flag is on.')
+    if clean:
+        print('Clean flag is set. Will clean intermediate results after processing.')
+    if max_proc != MAX_PROC:
+        print(f'Max processes set to {max_proc}')
+    if test:
+        print('Test flag is set. Enter testing mode. Will only analyze the decompiled code and will not analyze the (unstripped) binary file.')
+    if reason and not field:
+        print('[Warning] Posterior reasoning cannot be proceeded without field access information. Overwrite --field to true', file=sys.stderr)
+        field = True
+
+    dirs = get_dirs(source_dir)
+    # the binaries are listed from bin, or from decompiled in test mode if there is no bin folder
+    list_dir = dirs['bin'] if not test or os.path.isdir(dirs['bin']) else dirs['decompiled']
+    for d in (list_dir, dirs['decompiled']):
+        if not os.path.isdir(d):
+            print(f"Directory '{d}' does not exist.", file=sys.stderr)
+            sys.exit(1)
+
+    # the results of the previous run are kept, the stages of a binary are rerun only if needed (see get_stages)
+    for name in PER_FUNCTION_DIRS:
+        create_dir(dirs[name])
+    create_and_clean_dir(dirs['logs'])
+    if not test:
+        create_dir(dirs['dwarf_cache'])
+    if field:
+        create_dir(dirs['clang_cache'])
+        # group the functions of all binaries by body, so that the clang tools analyze each body once
+        create_and_clean_dir(dirs['dedup'])
+        dedup_map = dedup.build_dedup_map(dirs['decompiled'])
+        dump_json(os.path.join(dirs['dedup'], 'dedup_map.json'), dedup_map)
+        print(dedup.report(dedup_map))
+        duplicated = dedup.duplicated_by_binary(dedup_map)
+    else:
+        duplicated = {}
+
+    if list_dir == dirs['bin']:
+        binaries = sorted(get_file_list(list_dir))
+    else:
+        binaries = sorted(f[:-len('.decompiled')] for f in get_file_list(list_dir) if f.endswith('.decompiled'))
+
+    remove_stale(dirs, binaries)
+
+    # most expensive binaries first (LPT), so that the run does not end with a large binary processed alone
+    costs = {binname: estimate_cost(binname, dirs, test) for binname in binaries}
+    binaries.sort(key=lambda binname: costs[binname]['cost'], reverse=True)
+    workers_num = min(max_proc, len(binaries))
+    predicted = lpt_makespan([costs[binname]['cost'] for binname in binaries], workers_num)
+    print(f'Predicted makespan: {predicted:.1f}s')
+
+    # binaries done so far, also listed in completed_files
+    completed = set()
+    done_file = os.path.join(source_dir, 'completed_files')
+    open(done_file, 'w').close()
+
+    ctx = multiprocessing.get_context('fork')
+    tasks, done = ctx.Queue(), ctx.Queue()
+    workers = [ctx.Process(target=worker, args=(index, tasks, done, process_binary, (dirs, field, reason, test, max_proc, clang_server, duplicated)))
+               for index in range(workers_num)]
+    for p in workers:
+        p.start()
+    for binname in binaries:
+        tasks.put(binname)
+    for _ in workers:
+        tasks.put(None)
+
+    start = time.perf_counter()
+    failed = set()
+    current = {}   # worker index: the binary it is processing
+    # per binary: features, predicted and actual time, to check (and tune) the COST_* constants
+    with open(done_file, 'a') as f, open(os.path.join(dirs['logs'], 'schedule'), 'w') as schedule:
+        def finish(binname, elapsed, error):
+            if error is not None:
+                print(f'[ERROR] {binname} failed: {error}')
+                failed.add(binname)
+            else:
+                completed.add(binname)
+                f.write(binname + '\n')
+                f.flush()
+                cost = costs[binname]
+                schedule.write(f"{binname}\t{cost['decompiled_mb']:.3f}\t{cost['functions']}\t{cost['debug_info_mb']:.3f}\t{cost['cost']:.3f}\t{elapsed:.3f}\n")
+            print(f'=== Progress: {len(completed) + len(failed)}/{len(binaries)} ===')
+
+        while len(completed) + len(failed) < len(binaries):
+            try:
+                index, binname, elapsed, error = done.get(timeout=WORKER_POLL)
+            except queue.Empty:
+                # a killed worker (e.g. by the OOM killer) does not report its binary
+                for index, p in enumerate(workers):
+                    if index in current and not p.is_alive():
+                        finish(current.pop(index), None, f'worker exited with code {p.exitcode}')
+                if not any(p.is_alive() for p in workers):
+                    for binname in binaries:
+                        if binname not in completed and binname not in failed:
+                            finish(binname, None, 'no worker left')
+                continue
+            if elapsed is None:
+                current[index] = binname
+            else:
+                current.pop(index, None)
+                finish(binname, elapsed, error)
+    for p in workers:
+        p.join()
+    print(f'Makespan: predicted {predicted:.1f}s, actual {time.perf_counter() - start:.1f}s')
+    if failed:
+        print(f'[ERROR] {len(failed)} binaries failed: {" ".join(sorted(failed))}')
+
+    if clean:
+        print('Cleaning intermediate results.')
+        for name in ('decompiled_files', 'debuginfo_subprograms', 'align_var', 'logs', 'align_field', 'dedup'):
+            remove_folder_if_exists(dirs[name])
+        os.remove(done_file)
+        if not reason:
+            for name in ('decompiled_vars', 'field_access', 'callsite', 'dataflow'):
+                remove_folder_if_exists(dirs[name])
+
+    if field or test:
+        print(f"Data processing finished. The results can be found in {dirs['train_var']} and {dirs['train_field']}.")
+    else:
+        print(f"Data processing finished. The results can be found in {dirs['train_var']}")
+
+
+if __name__=='__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('source_dir', help='data folder with the bin and decompiled folders')
+    parser.add_argument('--field', action='store_true', help='also extract the field access information (FieldDecoder)')
+    parser.add_argument('--reason', action='store_true', help='keep the information needed for posterior reasoning (implies --field)')
+    parser.add_argument('--clean', action='store_true', help='remove the intermediate results after processing')
+    parser.add_argument('--test', action='store_true', help='only use the decompiled code, without ground truth')
+    parser.add_argument('--max_proc', type=int, default=MAX_PROC, help='number of binaries processed at the same time')
+    parser.add_argument('--clang_server', action='store_true', help='run the clang tools in server mode instead of starting them for every function (experimental)')
+    args = parser.parse_args()
+
+    main(args.source_dir, args.field, args.reason, args.clean, args.test, args.max_proc, args.clang_server)
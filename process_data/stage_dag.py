@@ -0,0 +1,183 @@
+import argparse
+import os
+import sys
+import shutil
+import subprocess
+import hashlib
+import json
+from utils import *
+from typing import Dict, List
+from error import StageError
+
+
+# make-style stages: a stage declares its inputs, outputs, params and tools (the code it runs). After a run,
+# its manifest records the hashes of all of them, and the stage is skipped as long as they are unchanged.
+# an input or output is a file, or a folder hashed recursively (e.g. the subfolder of a binary in a
+# per-function folder). The manifest also keeps the size, mtime and hash of every file, and a file whose size
+# and mtime are unchanged is not hashed again (as make, a rewrite with the same size and mtime goes unnoticed)
+
+MISSING = 'missing'   # hash of a path that does not exist
+MANIFEST_SUFFIX = '.json'
+
+
+def hash_file(path, known:Dict=None, files:Dict=None) -> str:
+    # known: {file: [size, mtime_ns, hash]} of the last run, files gets the entries of this run
+    stat = os.stat(path)
+    entry = (known or {}).get(path)
+    if entry and entry[0] == stat.st_size and entry[1] == stat.st_mtime_ns:
+        digest = entry[2]
+    else:
+        digest = sha256_file(path)
+    if files is not None:
+        files[path] = [stat.st_size, stat.st_mtime_ns, digest]
+    return digest
+
+
+def hash_path(path, known:Dict=None, files:Dict=None) -> str:
+    if os.path.isfile(path):
+        return hash_file(path, known, files)
+    if not os.path.isdir(path):
+        return MISSING
+    h = hashlib.sha256()
+    for root, dirs, filenames in os.walk(path):
+        dirs.sort()
+        for f in sorted(filenames):
+            h.update(f'{os.path.relpath(os.path.join(root, f), path)}\0{hash_file(os.path.join(root, f), known, files)}\n'.encode())
+    return h.hexdigest()
+
+
+def hash_paths(paths:List[str], known:Dict=None, files:Dict=None) -> Dict[str, str]:
+    return {path: hash_path(path, known, files) for path in paths}
+
+
+def read_manifest(manifest_path) -> Dict:
+    # None if missing or unreadable (e.g. a manifest left by an older, interrupted run): the stage reruns
+    try:
+        return read_json(manifest_path)
+    except (OSError, ValueError):
+        return None
+
+
+def write_manifest(manifest_path, manifest:Dict):
+    # written to a temporary file first, so that an interrupted run never leaves a partial manifest
+    os.makedirs(os.path.dirname(manifest_path) or '.', exist_ok=True)
+    tmp_path = f'{manifest_path}.tmp{os.getpid()}'
+    dump_json(tmp_path, manifest)
+    os.replace(tmp_path, manifest_path)
+
+
+def remove_path(path):
+    if os.path.isdir(path):
+        shutil.rmtree(path)
+        os.makedirs(path)
+    elif os.path.exists(path):
+        os.remove(path)
+
+
+class Stage():
+    def __init__(self, name, run, inputs=(), outputs=(), params=None, tools=()):
+        self.name = name
+        self.run = run   # returns False if the stage failed (no manifest is written then)
+        self.inputs = list(inputs)
+        self.outputs = list(outputs)
+        self.params = json.loads(json.dumps(params or {}))   # as read back from the manifest
+        self.tools = list(tools)   # files whose content is the version of the stage (scripts, executables)
+
+    def state(self, known:Dict=None, files:Dict=None) -> Dict:
+        return {'inputs': hash_paths(self.inputs, known, files), 'params': self.params, 'tools': hash_paths(self.tools, known, files)}
+
+    def update(self, manifest_path, verbose=True) -> bool:
+        # runs the stage if it is not up to date, returns whether it ran
+        manifest = read_manifest(manifest_path)
+        if not isinstance(manifest, dict):
+            manifest = {}
+        known = manifest.get('files', {})
+        files = {}
+        state = self.state(known, files)
+        if manifest.get('state') == state:
+            outputs = hash_paths(self.outputs, known, files)
+            if manifest.get('outputs') == outputs:
+                if verbose:
+                    print(f'[INFO] {self.name} is up to date, skipped.')
+                if files != known:
+                    # e.g. a touched file: its new mtime saves hashing it again next time
+                    write_manifest(manifest_path, {'name': self.name, 'state': state, 'outputs': outputs, 'files': files})
+                return False
+        if os.path.exists(manifest_path):
+            os.remove(manifest_path)
+        for path in self.outputs:
+            remove_path(path)
+        if self.run() is False:
+            return True
+        outputs = hash_paths(self.outputs, None, files)
+        write_manifest(manifest_path, {'name': self.name, 'state': state, 'outputs': outputs, 'files': files})
+        return True
+
+
+def sort_stages(stages:List[Stage]) -> List[Stage]:
+    # each stage after the stages producing its inputs, otherwise in the given order
+    producers = {}
+    for stage in stages:
+        for path in stage.outputs:
+            if path in producers:
+                raise StageError(f'{path} is an output of both {producers[path].name} and {stage.name}')
+            producers[path] = stage
+    order, visiting, done = [], set(), set()
+
+    def visit(stage):
+        if stage.name in done:
+            return
+        if stage.name in visiting:
+            raise StageError(f'cycle through stage {stage.name}')
+        visiting.add(stage.name)
+        for path in stage.inputs:
+            if path in producers:
+                visit(producers[path])
+        visiting.remove(stage.name)
+        done.add(stage.name)
+        order.append(stage)
+
+    for stage in stages:
+        visit(stage)
+    return order
+
+
+def run_stages(stages:List[Stage], manifest_dir, verbose=True) -> List[str]:
+    # updates the stages in dependency order, returns the names of the stages that ran
+    ran = []
+    for stage in sort_stages(stages):
+        if stage.update(os.path.join(manifest_dir, stage.name + MANIFEST_SUFFIX), verbose):
+            ran.append(stage.name)
+    return ran
+
+
+if __name__=='__main__':
+    # one stage of a shell pipeline: runs COMMAND unless the stage is up to date
+    parser = argparse.ArgumentParser()
+    parser.add_argument('manifest_dir')
+    parser.add_argument('name')
+    parser.add_argument('--inputs', nargs='*', default=[])
+    parser.add_argument('--outputs', nargs='*', default=[])
+    parser.add_argument('--params', nargs='*', default=[], metavar='KEY=VALUE')
+    parser.add_argument('--tools', nargs='*', default=[])
+    parser.add_argument('--stdout', help='write the output of COMMAND to this file (also an output of the stage)')
+    parser.usage = parser.format_usage()[len('usage: '):].rstrip() + ' -- COMMAND ...'
+    sep = sys.argv.index('--') if '--' in sys.argv else len(sys.argv)
+    args = parser.parse_args(sys.argv[1:sep])
+    command = sys.argv[sep + 1:]
+    if not command:
+        parser.error('missing -- COMMAND')
+    outputs = args.outputs + ([args.stdout] if args.stdout else [])
+    params = dict(param.split('=', 1) for param in args.params)
+
+    def run():
+        if args.stdout:
+            with open(args.stdout, 'w') as f:
+                returncode = subprocess.call(command, stdout=f)
+        else:
+            returncode = subprocess.call(command)
+        if returncode != 0:
+            print(f'[ERROR] {args.name} failed with exit code {returncode}', file=sys.stderr)
+            sys.exit(returncode)
+
+    Stage(args.name, run, args.inputs, outputs, params, args.tools).update(os.path.join(args.manifest_dir, args.name + MANIFEST_SUFFIX))
@@ -0,0 +1,25 @@
+from prep_decompiled import extract_comments, extract_comments_batch
+
+
+FUNCTION_POINTER_LOCAL = '''__int64 __fastcall sub_401000(int a1)
+{
+  int (*v3)(int);
+  __int64 (__fastcall *v4)(_QWORD, int);
+  int v5; // [rsp+Ch] [rbp-14h]
+  char v6[16]; // [rsp+10h] [rbp-10h] BYREF
+
+  v3 = sub_401100;
+  v5 = v3(a1); // [rbp-20h]
+  return v5;
+}'''
+
+
+def test_function_pointer_locals_do_not_end_the_declaration_block():
+    var_info = extract_comments(FUNCTION_POINTER_LOCAL.split('\n'))
+    assert [(var['name'], var['type'], var['array_size'], var['rbp_offset_dec']) for var in var_info] == \
+        [('v5', 'int', None, -0x14), ('v6', 'char', 16, -0x10)]
+
+
+def test_batch_is_per_function():
+    assert extract_comments_batch([FUNCTION_POINTER_LOCAL, 'void sub_401200()\n{\n  sub_401000(1);\n}']) == \
+        [extract_comments(FUNCTION_POINTER_LOCAL.split('\n')), []]
@@ -1,6 +1,9 @@
 import os
 import json
 import glob
+import resource
+import hashlib
+import re
 from typing import List, Dict
 
 
@@ -63,6 +66,206 @@ def dump_json(path, data):
         json.dump(data, f, indent=4)
 
 
+def iter_json_array(path, chunk_size=1 << 20):
+    # yield the elements of the top-level JSON array in path one at a time.
+    # Only chunk_size characters (plus the element being decoded) are held in memory
+    decoder = json.JSONDecoder()
+    with open(path, 'r') as f:
+        buf = ''
+        while not buf:
+            more = f.read(chunk_size)
+            if not more:
+                break
+            buf = more.lstrip()
+        if not buf.startswith('['):
+            raise ValueError(f'{path}: not a JSON array')
+        pos = 1
+        cnt = 0
+        expect_element = True   # right after '[' or ','
+        while True:
+            while pos < len(buf) and buf[pos] in ' \t\r\n':
+                pos += 1
+            if pos == len(buf):
+                more = f.read(chunk_size)
+                if not more:
+                    raise ValueError(f'{path}: unterminated JSON array')
+                buf, pos = more, 0
+                continue
+
+            if buf[pos] == ']' and (not expect_element or cnt == 0):
+                return
+            if not expect_element:
+                if buf[pos] != ',':
+                    raise ValueError(f'{path}: expected , or ] in the JSON array')
+                pos += 1
+                expect_element = True
+                continue
+
+            try:
+                element, end = decoder.raw_decode(buf, pos)
+            except json.JSONDecodeError:
+                end = None
+            if end is None or end == len(buf):
+                # the element (may) continue in the next chunk
+                more = f.read(chunk_size)
+                if more:
+                    buf, pos = buf[pos:] + more, 0
+                    continue
+                if end is None:
+                    raise ValueError(f'{path}: invalid JSON array element')
+            yield element
+            cnt += 1
+            pos = end
+            expect_element = False
+
+
+# legacy .decompiled format: a Python list of (addr, funname, code) tuples, as written by repr()
+_PY_INT = r'-?(?:0[xX][0-9a-fA-F]+|\d+)'
+_PY_STR = r'''(?:'[^'\\]*(?:\\.[^'\\]*)*'|"[^"\\]*(?:\\.[^"\\]*)*")'''
+_PY_VALUE = rf'({_PY_INT}|{_PY_STR}|None)'
+_LEGACY_RECORD = re.compile(rf'\s*[\(\[]\s*{_PY_VALUE}\s*,\s*{_PY_VALUE}\s*,\s*{_PY_VALUE}\s*,?\s*[\)\]]\s*(,|\])', re.S)
+_LEGACY_CLOSE = re.compile(r'\s*\]')
+
+def _py_literal(token:str):
+    # value of an int / str / None literal matched by _PY_VALUE
+    if token[0] in '\'"':
+        body = token[1:-1]
+        if '\\' not in body:
+            return body
+        # raw_unicode_escape keeps the backslashes and escapes the non-latin-1 characters, so that
+        # unicode_escape (which reads bytes as latin-1) decodes every escape the way Python does
+        return body.encode('raw_unicode_escape').decode('unicode_escape')
+    if token == 'None':
+        return None
+    return int(token, 0)
+
+
+def iter_legacy_decompiled(path, chunk_size=1 << 20):
+    # yield the (addr, funname, code) tuples of a legacy .decompiled file one at a time.
+    # Same result as eval() on the whole file for the literals repr() writes, without executing it
+    with open(path, 'r') as f:
+        buf, pos = '', 0
+        started = False   # the opening [ has been read
+        while True:
+            match = None
+            if not started:
+                if buf.strip():
+                    buf = buf.lstrip()
+                    if not buf.startswith('['):
+                        raise ValueError(f'{path}: not a list of tuples')
+                    pos, started = 1, True
+                    continue
+            else:
+                match = _LEGACY_RECORD.match(buf, pos)
+                if match is None and _LEGACY_CLOSE.match(buf, pos):
+                    return   # empty list, or a trailing comma
+            if match is None:
+                # the record (may) continue in the next chunk
+                more = f.read(chunk_size)
+                if not more:
+                    raise ValueError(f'{path}: cannot parse the record at "{buf[pos:pos+50]}"')
+                buf, pos = buf[pos:] + more, 0
+                continue
+            yield tuple(_py_literal(match.group(i)) for i in (1, 2, 3))
+            pos = match.end()
+            if match.group(4) == ']':
+                return
+
+
+def iter_decompiled(path):
+    # yield the functions {addr, funname, code} of a .decompiled file, in the JSON or the legacy format
+    with open(path, 'r') as f:
+        head = f.read(4096).lstrip()
+    if head.startswith('[') and head[1:].lstrip().startswith('('):
+        for addr, funname, code in iter_legacy_decompiled(path):
+            yield {'addr': addr, 'funname': funname, 'code': code}
+    else:
+        yield from iter_json_array(path)
+
+
+def sha256_file(path, block_size=1 << 20) -> str:
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            h.update(block)
+    return h.hexdigest()
+
+
+def peak_rss_mb(children=False) -> float:
+    # peak resident set size of the current process, or of its largest terminated child (ru_maxrss is in KB on Linux)
+    return resource.getrusage(resource.RUSAGE_CHILDREN if children else resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+TYPE_TABLE_DIR = 'types'   # subfolder of debuginfo_subprograms holding the per-binary type tables
+
+def get_type_table_path(subprogram_dir, binname):
+    return os.path.join(subprogram_dir, TYPE_TABLE_DIR, binname + '.json')
+
+
+# the per-function folders (decompiled_files, decompiled_vars, debuginfo_subprograms, align, field_access, ...)
+# have a subfolder per binary: <folder>/<binname>/<binname>-<addr>...
+
+def get_bin_dir(folder, binname, create=False) -> str:
+    bin_dir = os.path.join(folder, binname)
+    if create:
+        os.makedirs(bin_dir, exist_ok=True)
+    return bin_dir
+
+
+def get_fun_path(folder, fname, create=False) -> str:
+    # path of the per-function file fname (<binname>-<addr>...) in the subfolder of its binary
+    return os.path.join(get_bin_dir(folder, fname.rsplit('-', 1)[0], create), fname)
+
+
+def get_bin_list(folder) -> List[str]:
+    # the binaries with a subfolder in folder
+    if not os.path.isdir(folder):
+        return []
+    return sorted(d for d in os.listdir(folder) if d != TYPE_TABLE_DIR and os.path.isdir(os.path.join(folder, d)))
+
+
+def iter_fun_files(folder, target_bin=None):
+    # (subfolder, file name) of the per-function files of target_bin, of all binaries if None.
+    # only lists the subfolder of target_bin
+    for binname in [target_bin] if target_bin else get_bin_list(folder):
+        bin_dir = get_bin_dir(folder, binname)
+        for f in sorted(get_file_list(bin_dir)):
+            yield bin_dir, f
+
+
+class TypeTable():
+    # per-binary type table written by `parse_dwarf.py --type_table`.
+    # entries are expanded on first use into the same layout as an inline `type_attr`
+    def __init__(self, path):
+        self.types = read_json(path)   # type ID -> entry, fields refer to other entries by ID
+        self.expanded = {}   # (type ID, skip_recursive) -> expanded type_attr
+
+    def expand(self, type_ref, skip_recursive=False) -> Dict:
+        if isinstance(type_ref, dict):
+            # inlined type
+            return type_ref
+        key = (type_ref, skip_recursive)
+        if key not in self.expanded:
+            type_attr = self.types[type_ref].copy()
+            if not skip_recursive:
+                # same as DieDecription.attr_dict(): members of pointed-to structs are not expanded further
+                type_attr['struct_fields'] = [{'field_name': field['field_name'], 'field_attr': self.expand(field['field_attr'])} for field in type_attr['struct_fields']]
+                type_attr['point_to_struct_fileds'] = [{'field_name': field['field_name'], 'field_attr': self.expand(field['field_attr'], skip_recursive=True)} for field in type_attr['point_to_struct_fileds']]
+            else:
+                type_attr['struct_fields'] = []
+                type_attr['point_to_struct_fileds'] = []
+            self.expanded[key] = type_attr
+        return self.expanded[key]
+
+    def resolve(self, attr: Dict) -> Dict:
+        # fill in `type_attr` of a DIE's Attr dict that only refers to its type by `type_id`
+        if 'type_id' in attr and 'type_attr' not in attr:
+            type_attr = self.expand(attr['type_id']).copy()
+            type_attr['istype'] = True
+            attr['type_attr'] = type_attr
+        return attr
+
+
 def find_proj(metadata, binname):
     for proj, bins in metadata.items():
         if binname in bins:
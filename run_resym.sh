@@ -51,6 +51,11 @@ retrain_model_folder="$result_folder/models"
 mkdir -p "$train_data_folder"
 mkdir -p "$posterior_results_folder"
 
+# each step below is a stage (see process_data/stage_dag.py): it is skipped if its inputs, config values
+# and scripts did not change since its last run. process_data.py does the same per binary
+manifest_dir="$result_folder/manifests"
+stage="python $code_root/process_data/stage_dag.py $manifest_dir"
+
 # === Optional flags ===
 TEST_FLAG=""
 if [ "$test_mode" = true ]; then
@@ -111,7 +116,18 @@ bash process_data.sh "$data_root" $FIELD_FLAG $REASON_FLAG $TEST_FLAG $CLEAN_FLA
 # === Step 2: Generate JSONL Files ===
 cd "$code_root/process_data" || exit 1
 
+# the train/test split of the binaries is kept across runs (delete split.json for a new one). It is created
+# before the stages, which take it as an input
+python gen_jsonl.py --split_only \
+    --decompiled_folder "$data_root/decompiled" \
+    --output_folder "$train_data_folder" \
+    --train "$TRAIN_SPLIT" \
+    --test "$TEST_SPLIT"
+
 echo "[INFO] Generating JSONL for vardecoder..."
+$stage gen_jsonl_vardecoder --inputs "$data_root/train_var" "$data_root/decompiled" "$train_data_folder/split.json" \
+    --outputs "$train_data_folder/vardecoder_train.jsonl" "$train_data_folder/vardecoder_test.jsonl" \
+    --params "train=$TRAIN_SPLIT" "test=$TEST_SPLIT" --tools gen_jsonl.py utils.py -- \
 python gen_jsonl.py \
     --input_folder "$data_root/train_var" \
     --decompiled_folder "$data_root/decompiled" \
@@ -122,6 +138,9 @@ python gen_jsonl.py \
 
 if [ "$field" = true ]; then
     echo "[INFO] Generating JSONL for fielddecoder..."
+    $stage gen_jsonl_fielddecoder --inputs "$data_root/train_field" "$data_root/decompiled" "$train_data_folder/split.json" \
+        --outputs "$train_data_folder/fielddecoder_train.jsonl" "$train_data_folder/fielddecoder_test.jsonl" \
+        --params "train=$TRAIN_SPLIT" "test=$TEST_SPLIT" --tools gen_jsonl.py utils.py -- \
     python gen_jsonl.py \
         --input_folder "$data_root/train_field" \
         --decompiled_folder "$data_root/decompiled" \
@@ -143,7 +162,10 @@ if [ "$TRAIN_ON" = true ]; then
     var_ckpt_dir="$retrain_model_folder/vardecoder"
     field_ckpt_dir="$retrain_model_folder/fielddecoder"
     # Train VarDecoder
-    CUDA_VISIBLE_DEVICES=$VISIBLE_GPUS torchrun --nproc-per-node=$NUM_GPUS vardecoder_train.py \
+    CUDA_VISIBLE_DEVICES=$VISIBLE_GPUS $stage train_vardecoder --inputs "$train_data_folder/vardecoder_train.jsonl" --outputs "$var_ckpt_dir" \
+        --params "model_name=$MODEL_NAME" "max_token=$vardecoder_max_token_train" "lr=$LR" "epoch=$EPOCH" "batch_size=$BATCH_SIZE" "bf16=$BF16" "log_steps=$LOG_STEPS" \
+        --tools vardecoder_train.py -- \
+    torchrun --nproc-per-node=$NUM_GPUS vardecoder_train.py \
         "$train_data_folder/vardecoder_train.jsonl" \
         "$var_ckpt_dir" \
         --model_name "$MODEL_NAME" \
@@ -158,7 +180,10 @@ if [ "$TRAIN_ON" = true ]; then
 
     if [ "$field" = true ]; then
         # Train FieldDecoder
-        CUDA_VISIBLE_DEVICES=$VISIBLE_GPUS torchrun --nproc-per-node=$NUM_GPUS fielddecoder_train.py \
+        CUDA_VISIBLE_DEVICES=$VISIBLE_GPUS $stage train_fielddecoder --inputs "$train_data_folder/fielddecoder_train.jsonl" --outputs "$field_ckpt_dir" \
+            --params "model_name=$MODEL_NAME" "max_token=$fielddecoder_max_token_train" "lr=$LR" "epoch=$EPOCH" "batch_size=$BATCH_SIZE" "bf16=$BF16" "log_steps=$LOG_STEPS" \
+            --tools fielddecoder_train.py -- \
+        torchrun --nproc-per-node=$NUM_GPUS fielddecoder_train.py \
             "$train_data_folder/fielddecoder_train.jsonl" \
             "$field_ckpt_dir" \
             --model_name "$MODEL_NAME" \
@@ -175,7 +200,10 @@ fi
 
 echo "[INFO] Running inference..."
 cd "$code_root/training_src" || exit 1
-CUDA_VISIBLE_DEVICES=$VISIBLE_GPUS python vardecoder_inf.py \
+CUDA_VISIBLE_DEVICES=$VISIBLE_GPUS $stage inf_vardecoder --inputs "$train_data_folder/vardecoder_test.jsonl" "$vardecoder_ckpt" \
+    --outputs "$train_data_folder/vardecoder_pred.jsonl" \
+    --params "model_name=$MODEL_NAME" "max_token=$vardecoder_max_token_inf" "num_beams=$num_beams" --tools vardecoder_inf.py -- \
+python vardecoder_inf.py \
     "$train_data_folder/vardecoder_test.jsonl" \
     "$train_data_folder/vardecoder_pred.jsonl" \
     "$vardecoder_ckpt" \
@@ -185,7 +213,10 @@ CUDA_VISIBLE_DEVICES=$VISIBLE_GPUS python vardecoder_inf.py \
 
 if [ "$field" = true ]; then
     cd "$code_root/training_src" || exit 1
-    CUDA_VISIBLE_DEVICES=$VISIBLE_GPUS python fielddecoder_inf.py \
+    CUDA_VISIBLE_DEVICES=$VISIBLE_GPUS $stage inf_fielddecoder --inputs "$train_data_folder/fielddecoder_test.jsonl" "$fielddecoder_ckpt" \
+        --outputs "$train_data_folder/fielddecoder_pred.jsonl" \
+        --params "model_name=$MODEL_NAME" "max_token=$fielddecoder_max_token_inf" "num_beams=$num_beams" --tools fielddecoder_inf.py -- \
+    python fielddecoder_inf.py \
         "$train_data_folder/fielddecoder_test.jsonl" \
         "$train_data_folder/fielddecoder_pred.jsonl" \
         "$fielddecoder_ckpt" \
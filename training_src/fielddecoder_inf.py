@@ -3,9 +3,15 @@ import torch
 from transformers import AutoTokenizer, AutoModelForCausalLM
 import argparse
 import time
+import sys
+import hashlib
 from tqdm import tqdm
 import os 
 
+# the label normalization of the clang stage, to reuse the prediction of a prompt that only differs in its IDA labels
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'process_data'))
+from normalize import normalize_code, relabel
+
 hf_key = os.environ['HF_TOKEN']
 
 MAX_OUTPUT_TOKEN=1024
@@ -19,6 +25,10 @@ def inference(test_fpath, out_fpath, model_path, model_name, max_token, num_beam
     )
     model.eval()
     wp = open(out_fpath, 'w')
+    # key: sha256 of the prompt normalized by normalize_code, i.e. with the IDA labels (sub_XXXX, dword_XXXX, ...)
+    # numbered by first appearance and the stack offsets of the comments dropped. Prompts that only differ in
+    # those share a prediction, which assumes the model does not depend on them (generation is deterministic, no sampling).
+    predicted = {}   # key -> (output, labels of the prompt)
 
     with open(test_fpath, 'r') as fp:
         for i, line in enumerate(tqdm(fp.readlines())):
@@ -29,6 +39,21 @@ def inference(test_fpath, out_fpath, model_path, model_name, max_token, num_beam
             except:
                 continue
 
+            # the prompt ends with first_token, so the key covers it too
+            normalized, labels = normalize_code(prompt)
+            key = hashlib.sha256(normalized.encode()).hexdigest()
+            save_data = line
+            if key in predicted:
+                # same prompt as an earlier line up to the labels and stack offsets (e.g. a function shared by
+                # several binaries): its prediction, with each label of the earlier prompt in it replaced by the
+                # label at the same position in this prompt (relabel). time is 0, as no inference was run
+                output, src_labels = predicted[key]
+                save_data['predict'] = relabel(output, src_labels, labels)
+                save_data['time'] = 0.0
+                save_data['reused'] = True
+                wp.write(json.dumps(save_data) + '\n')
+                continue
+
             start_time = time.time()
             with torch.no_grad():
                 input_ids = tokenizer.encode(prompt, return_tensors='pt').cuda()[:, : max_token - MAX_OUTPUT_TOKEN]
@@ -46,9 +71,11 @@ def inference(test_fpath, out_fpath, model_path, model_name, max_token, num_beam
                 output = first_token + ':' + output
 
             time_used = time.time() - start_time
-            save_data = line
+            predicted[key] = (output, labels)
+
             save_data['predict'] = output
             save_data['time'] = time_used
+            save_data['reused'] = False
             wp.write(json.dumps(save_data) + '\n')
 
     print(f"Inference for FieldDecoder finished. The results can be found in {out_fpath}")
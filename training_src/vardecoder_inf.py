@@ -3,8 +3,14 @@ import torch
 from transformers import AutoTokenizer, AutoModelForCausalLM
 import argparse
 import time
+import sys
+import hashlib
 import os 
 from tqdm import tqdm
+# the label normalization of the clang stage, to reuse the prediction of a prompt that only differs in its IDA labels
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'process_data'))
+from normalize import normalize_code, relabel
+
 hf_key = os.environ['HF_TOKEN']
 
 MAX_OUTPUT_TOKEN=1024
@@ -19,6 +25,10 @@ def inference(test_fpath, out_fpath, model_path, model_name, max_token, num_beam
     model.eval()
 
     wp = open(out_fpath, 'w')
+    # key: sha256 of the prompt normalized by normalize_code, i.e. with the IDA labels (sub_XXXX, dword_XXXX, ...)
+    # numbered by first appearance and the stack offsets of the comments dropped. Prompts that only differ in
+    # those share a prediction, which assumes the model does not depend on them (generation is deterministic, no sampling).
+    predicted = {}   # key -> (output, labels of the prompt)
 
     with open(test_fpath, 'r') as fp:
         for i, line in enumerate(tqdm(fp.readlines())):
@@ -28,6 +38,21 @@ def inference(test_fpath, out_fpath, model_path, model_name, max_token, num_beam
                 first_token = line['first_token']
             except:
                 continue
+            # the prompt ends with first_token, so the key covers it too
+            normalized, labels = normalize_code(prompt)
+            key = hashlib.sha256(normalized.encode()).hexdigest()
+            save_data = line
+            if key in predicted:
+                # same prompt as an earlier line up to the labels and stack offsets (e.g. a function shared by
+                # several binaries): its prediction, with each label of the earlier prompt in it replaced by the
+                # label at the same position in this prompt (relabel). time is 0, as no inference was run
+                output, src_labels = predicted[key]
+                save_data['predict'] = relabel(output, src_labels, labels)
+                save_data['time'] = 0.0
+                save_data['reused'] = True
+                wp.write(json.dumps(save_data) + '\n')
+                continue
+
             start_time = time.time()
 
             with torch.no_grad():
@@ -50,9 +75,11 @@ def inference(test_fpath, out_fpath, model_path, model_name, max_token, num_beam
 
             time_used = time.time() - start_time
             output = first_token + ':' + output
-            save_data = line
+            predicted[key] = (output, labels)
+
             save_data['predict'] = output
             save_data['time'] = time_used
+            save_data['reused'] = False
             wp.write(json.dumps(save_data) + '\n')
 
 